@@ -34,7 +34,10 @@
 #
 
 # %%
+import hashlib
+
 import numpy as np
+import oip_graph  # the batch model equations
 import rand_dists_added as rda
 
 
@@ -195,6 +198,364 @@ disr_size_prob_cases = {
 
 disrSizes = np.array(disr_size_prob_cases["DisrSize"])
 disrProbs = np.array(disr_size_prob_cases["Case5EMF2005"])
+# decadal probabilities by case: row s for "Disruption Prob Case Selector" s
+disr_prob_table = np.array(
+    [v for k, v in disr_size_prob_cases.items() if k != "DisrSize"], dtype=float
+)
+
+
+def disr_probs_by_case(case_probs, prob_table=None):
+    """return N x J decadal disruption probabilities, a row per sample
+
+    case_probs -- length-N values of "Disruption Prob Case Selector" (rounded to a row);
+    prob_table -- cases x J array of probabilities (default = `disr_prob_table`)
+    """
+    if prob_table is None:
+        prob_table = disr_prob_table
+    return prob_table[np.rint(np.real(case_probs)).astype(int)]
+
+
+# %%
+# Disruption size distributions, discretized into many sizes (bins) along j
+# samples x sizes per chunk of the disruption calculations in `eval_cases_batch`
+disr_chunk_cells = 1 << 20
+
+
+def _size_bins(x, mass, edges):
+    """return (mean size, mass) of each bin between `edges` holding any mass"""
+    num_bins = len(edges) - 1
+    ndx = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, num_bins - 1)
+    bin_mass = np.bincount(ndx, mass, num_bins)
+    bin_moment = np.bincount(ndx, mass * x, num_bins)
+    keep = bin_mass > 0
+    return bin_moment[keep] / bin_mass[keep], bin_mass[keep]
+
+
+def disruption_size_bins(XList, CumProbList, prob10, num_bins=200):
+    """discretize a continuous disruption size distribution into `num_bins` sizes
+
+    XList, CumProbList -- piecewise linear CDF (as `rda.risk_cumul`) of the size
+            (MMBD) of a disruption, given that one occurs;
+    prob10 -- decadal probability of a disruption (of any size);
+    num_bins -- number of equal-width size bins (default = 200)\n
+    return (disrSizes, disrProbs), for `eval_cases_batch`: the mean size in each
+    bin, and its decadal probability (together summing to prob10); empty bins are dropped
+    """
+    XList = np.asarray(XList, dtype=float)
+    edges = np.linspace(XList[0], XList[-1], num_bins + 1)
+    knots = np.union1d(edges, XList)  # density is uniform between knots
+    mass = np.diff(np.interp(knots, XList, np.asarray(CumProbList, dtype=float)))
+    sizes, mass = _size_bins(0.5 * (knots[:-1] + knots[1:]), mass, edges)
+    return sizes, prob10 * mass / np.sum(mass)
+
+
+def disruption_size_bins_from_sample(sizes, prob10, num_bins=200, weights=None):
+    """discretize an empirical disruption size distribution into `num_bins` sizes
+
+    sizes -- observed or simulated sizes (MMBD) of disruptions;
+    prob10 -- decadal probability of a disruption (of any size);
+    num_bins -- number of equal-width size bins (default = 200);
+    weights -- optional weight of each size (default = equal weights)\n
+    return (disrSizes, disrProbs), as `disruption_size_bins`
+    """
+    sizes = np.asarray(sizes, dtype=float)
+    if weights is None:
+        weights = np.ones(len(sizes))
+    edges = np.linspace(sizes.min(), sizes.max(), num_bins + 1)
+    sizes, mass = _size_bins(sizes, np.asarray(weights, dtype=float), edges)
+    return sizes, prob10 * mass / np.sum(mass)
+
+
+# %% [markdown]
+# ### Parameter blocks: struct-of-arrays views of the parameter dictionaries
+
+# %%
+# (model symbol, dictionary key) for each field, in row order of the blocks below
+param_fields = [
+    ("u_gdp", "GDP disr loss elasticity"),
+    ("ru_gdp", "Ratio of Long-run GDP elas to SR GDP disr Elas"),
+    ("dEDelQ_dq_i", "Disruption reduction w/ imports"),
+    ("dlnQsodlnP", "OPEC LR Supply elasticity"),
+    ("Rho_E", "Shr Disr price incr anticipated"),
+    ("dQ_t_dq_i0", "Marg var tot (oil&nonoil) demand w/ ref imports"),
+    ("dQ_t_dq_i1", "Marg var tot (oil&nonoil) demand w/ opt imports"),
+    ("Rho_D", "Marg var of demand with imports"),
+    ("case_probs", "Disruption Prob Case Selector"),
+    ("L_disr", "Disruption Length (yrs)"),
+    ("F_o", "SPR Policy (Disr fract offset)"),
+    ("F_r", "SPR Policy (SPR fraction used)"),
+    ("F_e", "Effective Fraction of SPR Draw"),
+    ("n_dlr", "LR elas of US oil demand"),
+    ("n_slr", "LR elas of US oil supply"),
+    ("A_d", "adj rate domestic oil demand"),
+    ("A_s", "adj rate domestic oil supply"),
+    ("e_SNOr", "Elas:Other NonOPEC Supply"),
+    ("e_DNOr", "Elas:Other NonOPEC Demand"),
+    ("case_oilmkt", "Oil Market (AEO) Case"),
+]
+
+mkt_fields = [
+    ("P_i0", "import oil price"),
+    ("q_d0", "domestic oil demand"),
+    ("q_s0", "domestic oil production"),
+    ("q_n0", "domestic demand for oil substitutes (gas)"),
+    ("GDP_0", "undisrupted GDP"),
+    ("Q_SPR", "SPR Size (MMB)"),
+    ("q_INonUS_0", "NonUS Net Import Demand"),
+    ("S_OPEC", "OPEC Supply"),
+    ("S_tot", "Total World Supply"),
+    ("sigma_EurNon", "OECD_Europe as Fraction of NonUS Consumption"),
+]
+
+
+class FieldBlock:
+    """Fixed set of named fields backed by one contiguous float array.
+
+    `values` has one row per field (in the order of the class `fields` list) and
+    one column per case/sample; it is float, or complex if given complex values
+    (complex-step derivatives, see `premium_jacobian`). Each field is also readable as an attribute
+    named by its model symbol, e.g. `blk.u_gdp`, which returns row `values[i]`.
+    """
+
+    __slots__ = ("values",)
+    fields = []  # (symbol, key) pairs
+
+    def __init__(self, values):
+        values = np.asarray(values)
+        dtype = complex if np.iscomplexobj(values) else float
+        self.values = np.ascontiguousarray(values, dtype=dtype)
+        if self.values.ndim != 2 or self.values.shape[0] != len(self.fields):
+            raise ValueError(
+                "%s expects %d field rows, got shape %s"
+                % (type(self).__name__, len(self.fields), self.values.shape)
+            )
+
+    @classmethod
+    def keys(cls):
+        return [key for (sym, key) in cls.fields]
+
+    @classmethod
+    def from_dict(cls, d, cases=None, fill=None, fill_case=4):
+        """build a block from a dict of values keyed as `fields`
+
+        d -- dict of lists/arrays (a column per case or sample);
+        cases -- optional index (or list of indices) of the columns to take from `d`;
+        fill -- optional dict supplying keys missing from `d`, at column `fill_case`.
+        """
+        rows = []
+        for sym, key in cls.fields:
+            if key in d:
+                v = np.asarray(d[key], dtype=float).reshape(-1)
+                rows.append(v if cases is None else v[cases])
+            elif fill is not None:
+                rows.append(np.array([fill[key][fill_case]], dtype=float))
+            else:
+                raise KeyError(key)
+        n = max(np.size(r) for r in rows)
+        return cls(np.vstack([np.broadcast_to(r, (n,)) for r in rows]))
+
+    def to_dict(self):
+        return {key: self.values[i] for i, (sym, key) in enumerate(self.fields)}
+
+    def take(self, ndx):
+        """return a new block of the columns (cases/samples) `ndx`"""
+        return type(self)(self.values[:, ndx])
+
+    def __len__(self):
+        return self.values.shape[1]
+
+
+def _add_field_attributes(cls):
+    for i, (sym, key) in enumerate(cls.fields):
+        setattr(cls, sym, property(lambda self, i=i: self.values[i], doc=key))
+    return cls
+
+
+@_add_field_attributes
+class ParamBlock(FieldBlock):
+    """Key parameter values (rows of `alt_parameter_cases`) for N cases or samples"""
+
+    __slots__ = ()
+    fields = param_fields
+
+
+@_add_field_attributes
+class MarketBlock(FieldBlock):
+    """Oil market data (rows of `oilmkt_parameter_cases`) for N cases or samples"""
+
+    __slots__ = ()
+    fields = mkt_fields
+
+
+@_add_field_attributes
+class MarketTable:
+    """Read-only oil market data for all AEO cases and years, with an O(1) year index.
+
+    `values` has one row per market field (as `MarketBlock`) and one column per
+    (year, case) pair, at column `year_ndx * num_cases + case`, so the cases of
+    one year are adjacent. `block(year)` and `take(years, cases)` return
+    `MarketBlock`s, for one year or a (year, case) per sample; each field is also
+    readable as an attribute, a row of `values`.
+    """
+
+    __slots__ = ("years", "num_cases", "values", "_first_year", "_year_ndx")
+    fields = mkt_fields
+
+    def __init__(self, years, values, num_cases):
+        self.years = np.asarray(years, dtype=int)
+        self.num_cases = num_cases
+        self.values = np.array(values, dtype=float)
+        if self.values.shape != (len(mkt_fields), len(self.years) * num_cases):
+            raise ValueError(
+                "MarketTable expects shape %s, got %s"
+                % ((len(mkt_fields), len(self.years) * num_cases), self.values.shape)
+            )
+        self.years.flags.writeable = False
+        self.values.flags.writeable = False
+        # dense lookup from (year - first year) to year_ndx, -1 where missing
+        self._first_year = self.years.min()
+        self._year_ndx = np.full(self.years.max() - self._first_year + 1, -1)
+        self._year_ndx[self.years - self._first_year] = np.arange(len(self.years))
+
+    @classmethod
+    def from_market_data(cls, md, base=None, base_case=1):
+        """build a table from a dict of market data series by year
+
+        md -- dict of series keyed as `oilmkt_parameter_cases`, and "Year"; each series
+              is either one value per year (the `base_case` column) or a (years x cases) array;
+        base -- dict of values by case, for cases (and keys) not in `md`
+                (default = `oilmkt_parameter_cases`);
+        base_case -- case column of 1-d series in `md` (default = 1, the Mid AEO case)
+        """
+        if base is None:
+            base = oilmkt_parameter_cases
+        year_vals = np.asarray(md["Year"], dtype=float)
+        has_year = np.isfinite(year_vals)
+        years = np.rint(year_vals[has_year]).astype(int)
+        num_cases = len(base[mkt_fields[0][1]])
+        values = np.empty((len(mkt_fields), len(years), num_cases))
+        for i, (sym, key) in enumerate(mkt_fields):
+            values[i] = np.asarray(base[key], dtype=float)  # same for every year
+            if key not in md:
+                print("Missing market data for: ", key)
+                continue
+            series = np.asarray(md[key], dtype=float)[has_year]
+            if series.ndim == 2:
+                values[i] = series
+            else:
+                values[i, :, base_case] = series
+        return cls(years, values.reshape(len(mkt_fields), -1), num_cases)
+
+    def year_index(self, year):
+        """return position(s) of `year` (int or array of ints) in `years`"""
+        offset = np.asarray(year, dtype=int) - self._first_year
+        ndx = np.where(
+            (offset >= 0) & (offset < len(self._year_ndx)),
+            self._year_ndx[np.clip(offset, 0, len(self._year_ndx) - 1)],
+            -1,
+        )
+        if np.any(ndx < 0):
+            raise KeyError("no market data for year(s) %s" % np.unique(year))
+        return ndx
+
+    def block(self, year):
+        """return read-only `MarketBlock` of all cases for `year`"""
+        n = int(self.year_index(year))
+        mkt_cases = MarketBlock(
+            self.values[:, n * self.num_cases : (n + 1) * self.num_cases]
+        )
+        mkt_cases.values.flags.writeable = False
+        return mkt_cases
+
+    def columns(self, years, cases):
+        """return column index of each (year, case index) pair
+
+        years, cases -- broadcastable ints, e.g. the year and AEO case of each sample
+        """
+        years, cases = np.broadcast_arrays(years, cases)
+        return self.year_index(years) * self.num_cases + cases
+
+    def take(self, years, cases):
+        """return `MarketBlock` with a column for each (year, case index) pair
+
+        years, cases -- broadcastable ints, e.g. the year and AEO case of each sample
+        """
+        return MarketBlock(self.values[:, self.columns(years, cases)])
+
+
+# %% [markdown]
+# ### Market stage: derived market values, computed once per (year,) AEO case
+
+# %%
+# (model symbol, description) of the derived fields, after those of `mkt_fields`
+mkt_stage_fields = [
+    ("P_d0", "domestic oil price ($/BBL)"),
+    ("q_i0", "oil import level (MMBD)"),
+    ("S_NO_0", "Other NonOPEC Supply (MMBD)"),
+    ("q_DNonUS_0", "Other NonOPEC Demand (MMBD)"),
+    ("S_iToUS_0", "Net Import Supply to US (MMBD)"),
+    ("sigma_oUS_0", "share of GDP spent on oil (Unitless)"),
+    ("b_isSR", "SR import supply slope (MMBD/($/BBL))"),
+    ("F_DNO_fixed", "fixed fraction of Other NonOPEC Demand (Unitless)"),
+]
+
+
+@_add_field_attributes
+class MarketStage(FieldBlock):
+    """Market data and the values derived from it alone, for each (year,) AEO case
+
+    Rows are the fields of `mkt_fields` then `mkt_stage_fields`; columns match
+    those of the `MarketBlock` or `MarketTable` it was computed from.
+    """
+
+    __slots__ = ()
+    fields = mkt_fields + mkt_stage_fields
+
+
+market_stage_cache_size = 64  # market stages memoized (oldest dropped first)
+_market_stage_cache = {}
+# instrumentation: market stages computed, and reused from the cache
+market_stage_counts = {"computed": 0, "reused": 0}
+
+
+def clear_market_stage_cache():
+    """empty the market stage cache and reset `market_stage_counts`"""
+    _market_stage_cache.clear()
+    market_stage_counts.update(computed=0, reused=0)
+
+
+def market_stage(mkt_cases, OIP_switches):
+    """return `MarketStage` of `mkt_cases` (a `MarketBlock` or `MarketTable`), memoized
+
+    OIP_switches -- list of switches (only the OECD Europe demand constraint is used)\n
+    The stage is cached under a hash of the market values and the switch, so each
+    (year,) AEO case is derived once however many samples or batches use it.
+    """
+    Switch_ConstrOECDEurDemand = OIP_switches[3]
+    key = (
+        hashlib.sha1(np.ascontiguousarray(mkt_cases.values).tobytes()).hexdigest(),
+        mkt_cases.values.shape,
+        float(Switch_ConstrOECDEurDemand),
+    )
+    stage = _market_stage_cache.get(key)
+    if stage is not None:
+        market_stage_counts["reused"] += 1
+        return stage
+
+    # the market equations of `oip_graph.model`, for all columns at once
+    values = {sym: row for (sym, key), row in zip(mkt_fields, mkt_cases.values)}
+    oip_graph.model.evaluate(
+        [sym for sym, desc in mkt_stage_fields],
+        {"Switch_ConstrOECDEurDemand": Switch_ConstrOECDEurDemand},
+        values,
+    )
+    stage = MarketStage(np.vstack([values[sym] for sym, key in MarketStage.fields]))
+    stage.values.flags.writeable = False
+    market_stage_counts["computed"] += 1
+    if len(_market_stage_cache) >= market_stage_cache_size:
+        del _market_stage_cache[next(iter(_market_stage_cache))]  # oldest
+    _market_stage_cache[key] = stage
+    return stage
 
 
 # %% [markdown]
@@ -242,14 +603,21 @@ disrProbs = np.array(disr_size_prob_cases["Case5EMF2005"])
 #
 
 # %%
+root_seed = np.random.SeedSequence()  # root of the simulation random streams
+
+
 def init_OIP(replicable=False):
     """Initialize variables, parameters, and random functions for OIP.
     Parameter replicable=False if random seed is to be "randomized" based on system clock.
+    Also resets `root_seed`, from which each simulation spawns its random streams.
     """
+    global root_seed
     if replicable:
         np.random.seed(1)  # initialize seed based a particular starting point
+        root_seed = np.random.SeedSequence(1)
     else:
         np.random.seed()  # initialize seed based on system clock
+        root_seed = np.random.SeedSequence()  # seed from OS entropy
 
 
 # %%
@@ -1060,6 +1428,348 @@ def eval_one_case(alt_parameter_cases, disrSizes, disrProbs, OIP_switches, debug
 # ======================================================================
 
 
+# %% [markdown]
+# ### `eval_cases_batch()`: Evaluation of N cases at once (Monte Carlo samples as arrays)
+
+
+# %%
+def batch_inputs(
+    params, disrSizes, disrProbs, OIP_switches, mkt_cases=None, years=None, P_d1=None
+):
+    """return dict of the inputs of `oip_graph.model` for N sets of param values
+
+    params, disrSizes, disrProbs, OIP_switches, mkt_cases, years, P_d1 -- as for
+    `eval_cases_batch`\n
+    Params are (N, 1) per sample; each sample's market data and disruption
+    probabilities are gathered by the model, from `mkt_cases` and `disr_prob_table`.
+    """
+    if not isinstance(params, ParamBlock):
+        params = ParamBlock.from_dict(params, fill=alt_parameter_cases)
+    if mkt_cases is None:
+        mkt_cases = MarketBlock.from_dict(oilmkt_parameter_cases)
+    inputs = {sym: getattr(params, sym)[:, np.newaxis] for sym, key in param_fields}
+    inputs["mkt_cases"] = mkt_cases
+    if isinstance(mkt_cases, MarketTable):
+        if years is None:
+            raise ValueError("years are required with a MarketTable of market data")
+        inputs["years"] = years
+    else:
+        inputs["years"] = None
+    inputs["disrSizes"] = disrSizes
+    inputs["disrProbs"] = disrProbs
+    inputs["disr_prob_table"] = disr_prob_table
+    inputs["Switch_DomDem_ElasMult"] = OIP_switches[2]
+    inputs["Switch_ConstrOECDEurDemand"] = OIP_switches[3]
+    inputs["P_d1"] = (
+        None if P_d1 is None else np.asarray(P_d1, dtype=float).reshape(-1, 1)
+    )
+    return inputs
+
+
+# %%
+def eval_cases_batch(
+    params,
+    disrSizes,
+    disrProbs,
+    OIP_switches,
+    mkt_cases=None,
+    debug=False,
+    years=None,
+    P_d1=None,
+    return_state=False,
+    outputs=None,
+):
+    """complete OIP calculation for one year and N sets of param values at once
+
+    params -- `ParamBlock` of N sets of param values, or dict of sampled param values
+    keyed as in `alt_parameter_cases`, each a length-N array (params not present are
+    taken from the RandomFix case);
+    disrSizes -- disruption sizes (length J);
+    disrProbs -- decadal disruption probabilities (length J, or N x J for a set per sample,
+    or None for the row of `disr_prob_table` picked by each sample's "Disruption Prob Case
+    Selector");
+    OIP_switches -- list of switches also governing cases;
+    mkt_cases -- `MarketBlock` of market data by AEO case (default: from `oilmkt_parameter_cases`),
+    or `MarketTable` of market data by year and AEO case, the column of each sample
+    picked by its "Oil Market (AEO) Case";
+    debug=False -- report number of invalid (NaN) samples if True;
+    years -- year (or length-N array of years) of the samples, required if `mkt_cases` is a
+    `MarketTable` (ValueError if None);
+    P_d1 -- optional domestic oil price (length N) of the Opt case: if given, the
+    premium is evaluated at the market state it implies, instead of the Ref case;
+    return_state=False -- if True, also return the market state evaluated;
+    outputs -- names of the model variables to return (default = `oip_graph.pi_components`)\n
+    return `pi_components` a numpy array of dim N x 14, each row as returned by `eval_one_case`
+    (N x len(outputs) if `outputs` given, variables along j summed),
+    or (pi_components, state) if `return_state`, state a dict of length-N arrays
+    P_d, P_i, q_d, q_s, q_i and T (implicit tariff)\n
+
+    Array-native version of `eval_one_case`: evaluates the equations of `oip_graph.model`
+    needed for `outputs`, samples along axis 0, and the disruption-size index j along
+    axis 1. Diagnostics marked <-Unused-> are only computed if asked for.
+    """
+    if not isinstance(params, ParamBlock):
+        params = ParamBlock.from_dict(params, fill=alt_parameter_cases)
+    if mkt_cases is None:
+        mkt_cases = MarketBlock.from_dict(oilmkt_parameter_cases)
+    if outputs is None:
+        outputs = oip_graph.pi_components
+    num_samples = len(params)
+    inputs = batch_inputs(
+        params, disrSizes, disrProbs, OIP_switches, mkt_cases, years, P_d1
+    )
+
+    # Market stage (memoized) for the (year,) AEO case of each sample, each (N, 1):
+    # known values, so the model does not derive them again per sample
+    stage = market_stage(mkt_cases, OIP_switches)
+    values = oip_graph.model.evaluate(["mkt_column"], inputs)
+    mkt = stage.values[:, values["mkt_column"]]
+    values.update(
+        {sym: row[:, np.newaxis] for (sym, key), row in zip(stage.fields, mkt)}
+    )
+
+    # Sample stage and disruption work, (N, J), over chunks of disruption sizes j
+    # of up to `disr_chunk_cells` cells; the reductions over j are sums,
+    # accumulated chunk by chunk
+    state_vars = {"P_d": "P_dk", "P_i": "P_ik", "q_d": "q_dk", "q_s": "q_sk"}
+    state_vars.update({"q_i": "q_ik", "T": "T_k"})  # T: implicit tariff ($/BBL)
+    oip_graph.model.evaluate_chunked(
+        list(outputs) + (list(state_vars.values()) if return_state else []),
+        inputs,
+        oip_graph.j_inputs,
+        oip_graph.j_sums,
+        max(1, disr_chunk_cells // max(num_samples, 1)),
+        values,
+    )
+    pi_components = oip_graph.as_columns(values, outputs, num_samples)
+
+    if debug:
+        print(
+            "eval_cases_batch: %d samples, %d invalid (NaN)"
+            % (num_samples, np.count_nonzero(np.isnan(pi_components).any(axis=1)))
+        )
+
+    if return_state:
+        state = {
+            k: np.broadcast_to(values[v], (num_samples, 1))[:, 0].copy()
+            for k, v in state_vars.items()
+        }
+        return pi_components, state
+    return pi_components
+
+
+# %%
+complex_step = 1e-30  # imaginary step of `premium_jacobian`
+rounded_params = ("case_probs", "case_oilmkt")  # selectors: zero derivative
+
+
+def premium_jacobian(
+    params, disrSizes, disrProbs, OIP_switches, mkt_cases=None, years=None
+):
+    """premium components and their derivatives by param, for N sets of param values
+
+    params, disrSizes, disrProbs, OIP_switches, mkt_cases, years -- as for `eval_cases_batch`\n
+    return (pi_components, jac): the N x 14 premium components, and jac (N x params x 14)
+    their derivatives by each param of `param_fields` (zero for the `rounded_params`)\n
+
+    Derivatives by the complex step: each param in turn (but the `rounded_params`) is
+    given an imaginary part of `complex_step`, and the whole equation chain of
+    `eval_cases_batch` carried through in complex arithmetic, in one batch of N x 18
+    rows. The imaginary part of each result is the derivative times the step, with
+    no differencing error, so the derivatives are exact to rounding. The cost is
+    O(params): 18 evaluations in complex arithmetic, some 40-70 times one
+    `eval_cases_batch` of the N samples (more with many disruption sizes), about
+    that of central differences (2 real evaluations per param) or more; the gain is
+    accuracy, not speed (see `testOIP.check_premium_jacobian` for timings).
+    """
+    if not isinstance(params, ParamBlock):
+        params = ParamBlock.from_dict(params, fill=alt_parameter_cases)
+    num_samples = len(params)
+    varied = [
+        p for p, (sym, key) in enumerate(param_fields) if sym not in rounded_params
+    ]
+    num_varied = len(varied)
+    points = np.repeat(params.values.astype(complex), num_varied, axis=1)
+    points[np.tile(varied, num_samples), np.arange(num_samples * num_varied)] += (
+        1j * complex_step
+    )
+    if years is not None:
+        years = np.repeat(
+            np.broadcast_to(np.asarray(years), (num_samples,)), num_varied
+        )
+    if np.ndim(disrProbs) == 2:
+        disrProbs = np.repeat(disrProbs, num_varied, axis=0)
+    out = eval_cases_batch(
+        ParamBlock(points),
+        disrSizes,
+        disrProbs,
+        OIP_switches,
+        mkt_cases=mkt_cases,
+        years=years,
+    ).reshape(num_samples, num_varied, -1)
+    jac = np.zeros((num_samples, len(param_fields), out.shape[2]))
+    jac[:, varied] = out.imag / complex_step
+    return out[:, 0].real, jac
+
+
+# %%
+opt_bound = 0.01  # lower bound of P_i1, P_d1, q_d1, q_s1 in the Opt case
+
+
+def solve_opt_cases(
+    params,
+    disrSizes,
+    disrProbs,
+    OIP_switches,
+    mkt_cases=None,
+    years=None,
+    tol=1e-5,
+    maxiter=60,
+    debug=False,
+):
+    """solve the Opt (optimal tariff) case for N sets of param values at once
+
+    params, disrSizes, disrProbs, OIP_switches, mkt_cases, years -- as for `eval_cases_batch`;
+    tol -- convergence tolerance of ConvTest ($/BBL) (default = 1e-5);
+    maxiter -- maximum iterations, each of bracketing and of Newton/bisection (default = 60);
+    debug=False -- report convergence if True\n
+    return (pi_components, opt): the N x 14 premium components at the Opt case, and a dict
+    of length-N arrays P_d1, P_i1, q_d1, q_s1, q_i1, T_1, PREM_1, ConvTest,
+    iterations and converged (bool)\n
+
+    Port of the workbook Solver model: for each sample, find P_d1 with
+    ConvTest = ABS(T_1-PREM_1) = 0, subject to P_i1, P_d1, q_d1, q_s1 >= 0.01 and T_1 > 0.
+    T_1 - PREM_1 is negative at the Ref case (T_1 = 0), so P_d1 is bracketed upward from
+    P_d0, then refined by Newton steps (forward-difference slope, evaluated in the same
+    batch), falling back to bisection when a step leaves the bracket. Samples drop out
+    of the batch as they converge. Samples not converged keep their last iterate (the
+    Ref case, if no bracket was found). The workbook's MktBalance constraint,
+    ABS(q_d1-q_s1-q_i1) = 0, holds by construction: q_i1 = q_d1 - q_s1 at any P_d1.
+    """
+    if not isinstance(params, ParamBlock):
+        params = ParamBlock.from_dict(params, fill=alt_parameter_cases)
+    num_samples = len(params)
+    if years is not None:
+        years = np.broadcast_to(np.asarray(years), (num_samples,))
+
+    def residual(ndx, P):
+        """(pi_components, state, T_1 - PREM_1, feasible) of samples `ndx` at P_d1 = `P`"""
+        pi, state = eval_cases_batch(
+            params.take(ndx),
+            disrSizes,
+            disrProbs if np.ndim(disrProbs) < 2 else disrProbs[ndx],
+            OIP_switches,
+            mkt_cases=mkt_cases,
+            years=None if years is None else years[ndx],
+            P_d1=P,
+            return_state=True,
+        )
+        f = state["T"] - pi[:, 0]
+        lowest = np.minimum.reduce([state[k] for k in ["P_i", "P_d", "q_d", "q_s"]])
+        return pi, state, f, np.isfinite(f) & (lowest >= opt_bound)
+
+    def keep(ndx, pi, state):
+        pi_out[ndx] = pi
+        for k, v in state.items():
+            state_out[k][ndx] = v
+
+    # Ref case: the lower end of every bracket
+    allndx = np.arange(num_samples)
+    pi_out, state_out = eval_cases_batch(
+        params,
+        disrSizes,
+        disrProbs,
+        OIP_switches,
+        mkt_cases=mkt_cases,
+        years=years,
+        return_state=True,
+    )
+    P_lo = state_out["P_d"].copy()
+    f_lo = state_out["T"] - pi_out[:, 0]
+    P_hi = np.full(num_samples, np.nan)
+    f_hi = np.full(num_samples, np.nan)
+    iterations = np.zeros(num_samples, dtype=int)
+    converged = np.zeros(num_samples, dtype=bool)
+
+    # Bracketing: raise P_d1 (doubling the step) until T_1 - PREM_1 > 0, halving
+    # the step instead where the bounds are violated
+    step = np.maximum(-f_lo, tol)
+    active = allndx[np.isfinite(f_lo) & (f_lo < 0)]
+    for it in range(maxiter):
+        if len(active) == 0:
+            break
+        P = P_lo[active] + step[active]
+        pi, state, f, ok = residual(active, P)
+        iterations[active] += 1
+        up = ok & (f < 0)
+        P_lo[active[up]] = P[up]
+        f_lo[active[up]] = f[up]
+        step[active[up]] *= 2.0
+        step[active[~ok]] *= 0.5
+        done = ok & (f >= 0)
+        P_hi[active[done]] = P[done]
+        f_hi[active[done]] = f[done]
+        keep(active[done], pi[done], {k: v[done] for k, v in state.items()})
+        active = active[~done]
+
+    # Safeguarded Newton: each batch evaluates P_d1 and P_d1 + h for the slope
+    active = allndx[np.isfinite(P_hi)]
+    converged[active] = np.abs(f_hi[active]) < tol
+    active = active[~converged[active]]
+    P = P_lo[active] - f_lo[active] * (P_hi[active] - P_lo[active]) / (
+        f_hi[active] - f_lo[active]
+    )  # secant start
+    for it in range(maxiter):
+        if len(active) == 0:
+            break
+        n = len(active)
+        h = 1e-7 * np.maximum(P, 1.0)
+        pi, state, f, ok = residual(
+            np.concatenate([active, active]), np.concatenate([P, P + h])
+        )
+        pi, f, f_h, ok, ok_h = pi[:n], f[:n], f[n:], ok[:n], ok[n:]
+        state = {k: v[:n] for k, v in state.items()}
+        iterations[active] += 1
+        keep(active[ok], pi[ok], {k: v[ok] for k, v in state.items()})
+        below = ok & (f < 0)  # infeasible points leave the bracket unchanged
+        above = ok & (f >= 0)
+        P_lo[active[below]] = P[below]
+        P_hi[active[above]] = P[above]
+        done = ok & (np.abs(f) < tol)
+        converged[active[done]] = True
+        with np.errstate(divide="ignore", invalid="ignore"):
+            P_new = P - f * h / (f_h - f)
+        lo, hi = P_lo[active], P_hi[active]
+        bisect = ~ok | ~ok_h | ~np.isfinite(P_new) | (P_new <= lo) | (P_new >= hi)
+        P_new[bisect] = 0.5 * (lo + hi)[bisect]
+        P = P_new[~done]
+        active = active[~done]
+
+    opt = {
+        "P_d1": state_out["P_d"],
+        "P_i1": state_out["P_i"],
+        "q_d1": state_out["q_d"],
+        "q_s1": state_out["q_s"],
+        "q_i1": state_out["q_i"],
+        "T_1": state_out["T"],
+        "PREM_1": pi_out[:, 0],
+        "ConvTest": np.abs(state_out["T"] - pi_out[:, 0]),
+        "iterations": iterations,
+        "converged": converged,
+    }
+    if debug:
+        print(
+            "solve_opt_cases: %d of %d samples converged, max ConvTest %g, max %d iterations"
+            % (
+                np.count_nonzero(converged),
+                num_samples,
+                np.max(opt["ConvTest"][converged], initial=0.0),
+                np.max(iterations, initial=0),
+            )
+        )
+    return pi_out, opt
+
+
 # %%
 """
 #                                                                   (            )
@@ -0,0 +1,935 @@
+# -*- coding: utf-8 -*-
+"""
+oip_graph.py
+The batch OIP model as a graph of named equations, evaluated on demand: asking
+for some outputs computes only their transitive dependencies, in topological order.
+These are the equations of `OIP.eval_cases_batch` (which evaluates this graph over
+chunks of disruption sizes, see `EquationGraph.evaluate_chunked`) and of
+`OIP.market_stage`; `OIP.eval_one_case` is the scalar port of the workbook.
+
+    Inputs: param symbols (`OIP.param_fields`) as arrays of dim (N, 1); the
+            market data `mkt_cases` (`OIP.MarketBlock` or `OIP.MarketTable`) and
+            `years` (None but for a table); disrSizes, disrProbs (length J, N x J,
+            or None for the rows of `disr_prob_table`); the two switches used; and
+            P_d1 (None for the Ref case). `OIP.batch_inputs` builds them. Each
+            sample's market data and disruption probabilities are equations of its
+            selectors, so changing a selector invalidates what was gathered by it.
+    Equations: one function per model variable, named as the variable, with
+            arguments named after the variables it depends on; diagnostics the
+            workbook marks <-Unused-> are equations too, computed only if asked for.
+"""
+import inspect
+
+import numpy as np
+import pandas as pd
+
+
+class EquationGraph:
+    """Model variables, each defined by an equation of other variables
+
+    Equations are added with the `equation` decorator; any variable that is not
+    defined by an equation is an input.
+    """
+
+    def __init__(self):
+        self.equations = {}  # name -> (function, dependency names, description)
+
+    def equation(self, description=""):
+        """decorator adding function `fn` as the equation of variable `fn.__name__`"""
+
+        def add(fn):
+            deps = tuple(inspect.signature(fn).parameters)
+            self.equations[fn.__name__] = (fn, deps, description)
+            return fn
+
+        return add
+
+    # ---------------------------------------------------------------------
+    def deps(self, name):
+        """direct dependencies of `name` (none for an input)"""
+        return self.equations[name][1] if name in self.equations else ()
+
+    def order(self, outputs, known=()):
+        """return the equations needed for `outputs`, in topological order
+
+        known -- variables whose value is known: neither they nor what only they
+                need are returned
+        """
+        order = []
+        state = {}  # name -> "visiting" or "done"
+
+        def visit(name):
+            if state.get(name) == "done" or name not in self.equations:
+                return
+            if name in known:
+                return
+            if state.get(name) == "visiting":
+                raise ValueError("equation cycle through %s" % name)
+            state[name] = "visiting"
+            for dep in self.deps(name):
+                visit(dep)
+            state[name] = "done"
+            order.append(name)
+
+        for name in outputs:
+            visit(name)
+        return order
+
+    def inputs(self, outputs):
+        """return the inputs `outputs` depend on"""
+        needed = set(outputs) | {d for n in self.order(outputs) for d in self.deps(n)}
+        return sorted(n for n in needed if n not in self.equations)
+
+    def dependents(self, names):
+        """return all variables depending, directly or not, on any of `names`"""
+        names = set(names)
+        found = set()
+        for name in self.order(list(self.equations)):  # dependencies come first
+            if any(d in names or d in found for d in self.deps(name)):
+                found.add(name)
+        return found
+
+    def table(self, outputs=None):
+        """dataframe of the equations (of `outputs`, default all): name, dependencies,
+        description, in topological order"""
+        names = self.order(list(self.equations) if outputs is None else outputs)
+        return pd.DataFrame(
+            [(n, ", ".join(self.deps(n)), self.equations[n][2]) for n in names],
+            columns=["variable", "depends_on", "description"],
+        )
+
+    # ---------------------------------------------------------------------
+    def evaluate(self, outputs, inputs, values=None):
+        """return dict of the values of `outputs`, and of everything computed for them
+
+        inputs -- dict of input values
+        values -- optional dict of variable values already known (updated in place)
+        """
+        values = {} if values is None else values
+        for name in self.order(outputs, values):
+            fn, deps, desc = self.equations[name]
+            values[name] = fn(*[values[d] if d in values else inputs[d] for d in deps])
+        return values
+
+    def evaluate_chunked(self, outputs, inputs, along, sums, chunk, values=None):
+        """as `evaluate`, but computing the variables that depend on `along` over
+        chunks of their axis 1, to bound the size of intermediate arrays
+
+        along -- names of the variables (or inputs) with an axis 1 to chunk, e.g. along
+                disruption sizes j
+        sums -- equations summing over axis 1 (keepdims) variables depending on `along`:
+                evaluated chunk by chunk and accumulated, everything depending on them
+                is then evaluated once
+        chunk -- positions of axis 1 per chunk\n
+        Variables along axis 1 asked for in `outputs` are computed whole, at the end.
+        """
+        values = self.evaluate(along, inputs, values)
+        full = {n: values[n] if n in values else inputs[n] for n in along}
+        size = max(np.shape(x)[1] for x in full.values())
+        sums = [n for n in self.order(outputs) if n in sums and n not in values]
+        if size > chunk and sums:
+            chunked = self.dependents(along)
+            self.evaluate(
+                [n for n in self.order(sums) if n not in chunked], inputs, values
+            )
+            totals = {n: 0.0 for n in sums}
+            for j0 in range(0, size, chunk):
+                part = {n: v for n, v in values.items() if n not in chunked}
+                part.update({n: x[:, j0 : j0 + chunk] for n, x in full.items()})
+                self.evaluate(sums, inputs, part)
+                totals = {n: totals[n] + part[n] for n in sums}
+            values.update(totals)
+        return self.evaluate(outputs, inputs, values)
+
+
+def along_j(x):
+    """disruption sizes or probabilities as (1 or N, J)"""
+    x = np.asarray(x, dtype=float)
+    return x if x.ndim == 2 else x.reshape(1, -1)
+
+
+model = EquationGraph()
+eq = model.equation
+
+# premium components, in the column order of `OIP.eval_cases_batch`
+pi_components = [
+    "pi_tot",
+    "pi_m",
+    "pi_di",
+    "pi_dm",
+    "pi_d",
+    "E_MCdis_vul_monops_k",
+    "E_MCdis_vul_dGDP_k",
+    "E_MCdis_vul_dDWL_k",
+    "E_MCdis_vul_dFC_k",
+    "E_MCdis_vul_deGDP_k",
+    "E_MCdis_size_dSSdDWL_k",
+    "E_MCdis_size_dFC_k",
+    "E_MCdis_size_dGNPdDelP_k",
+    "MCmonopsony_k",
+]
+
+# inputs along disruption sizes j, and the sums over j, each the sum of Prob_Yj times a
+# per-size term (its summand at Prob_Yj = 1): `OIP.eval_cases_batch` evaluates the
+# model over chunks of j (see `EquationGraph.evaluate_chunked`), `Reweighting`
+# reweights the terms
+j_inputs = ["DeltaQ_g_j", "Prob10_j"]
+j_sums = {
+    "sum_w_kj": "w_kj",
+    "EDelP_k": "PrDeltaP_kj",
+    "sum_MCdis_vul_monops_kj": "MCdis_vul_monops_kj",
+    "sum_MCdis_vul_dGDP_kj": "MCdis_vul_dGDP_kj",
+    "sum_MCdis_vul_dDWL_kj": "MCdis_vul_dDWL_kj",
+    "sum_MCdis_vul_dFC_kj": "MCdis_vul_dFC_kj",
+    "sum_MCdis_size_dSSdDWL_kj": "MCdis_size_dSSdDWL_kj",
+    "sum_MCdis_size_dFC_kj": "MCdis_size_dFC_kj",
+    "sum_MCdis_size_dGNPdDelP_kj": "MCdis_size_dGNPdDelP_kj",
+}
+
+
+# %%
+# Inputs gathered by each sample's selectors: its market data (by "Oil Market (AEO)
+# Case", and year for a `OIP.MarketTable`) and its disruption probabilities
+@eq("column of each sample in the market data `mkt_cases` (years None but for a table)")
+def mkt_column(case_oilmkt, mkt_cases, years):
+    case_oilmktndx = np.rint(np.real(case_oilmkt[:, 0]) - 1).astype(int)
+    if years is None:
+        if hasattr(mkt_cases, "columns"):  # a table of years needs them
+            raise ValueError("years are required to gather from a market table")
+        return case_oilmktndx
+    return mkt_cases.columns(years, case_oilmktndx)
+
+
+@eq("import oil price")
+def P_i0(mkt_cases, mkt_column):
+    return mkt_cases.P_i0[mkt_column][:, np.newaxis]
+
+
+@eq("domestic oil demand")
+def q_d0(mkt_cases, mkt_column):
+    return mkt_cases.q_d0[mkt_column][:, np.newaxis]
+
+
+@eq("domestic oil production")
+def q_s0(mkt_cases, mkt_column):
+    return mkt_cases.q_s0[mkt_column][:, np.newaxis]
+
+
+@eq("domestic demand for oil substitutes (gas)")
+def q_n0(mkt_cases, mkt_column):
+    return mkt_cases.q_n0[mkt_column][:, np.newaxis]
+
+
+@eq("undisrupted GDP")
+def GDP_0(mkt_cases, mkt_column):
+    return mkt_cases.GDP_0[mkt_column][:, np.newaxis]
+
+
+@eq("SPR Size (MMB)")
+def Q_SPR(mkt_cases, mkt_column):
+    return mkt_cases.Q_SPR[mkt_column][:, np.newaxis]
+
+
+@eq("NonUS Net Import Demand")
+def q_INonUS_0(mkt_cases, mkt_column):
+    return mkt_cases.q_INonUS_0[mkt_column][:, np.newaxis]
+
+
+@eq("OPEC Supply")
+def S_OPEC(mkt_cases, mkt_column):
+    return mkt_cases.S_OPEC[mkt_column][:, np.newaxis]
+
+
+@eq("Total World Supply")
+def S_tot(mkt_cases, mkt_column):
+    return mkt_cases.S_tot[mkt_column][:, np.newaxis]
+
+
+@eq("OECD_Europe as Fraction of NonUS Consumption")
+def sigma_EurNon(mkt_cases, mkt_column):
+    return mkt_cases.sigma_EurNon[mkt_column][:, np.newaxis]
+
+
+@eq("disruption sizes, gross (MMBD)")
+def DeltaQ_g_j(disrSizes):
+    return along_j(disrSizes)
+
+
+@eq(
+    "Decade_P: disrProbs, or the row of `disr_prob_table` by Disruption Prob Case Selector"
+)
+def Prob10_j(disrProbs, case_probs, disr_prob_table):
+    if disrProbs is None:
+        return disr_prob_table[np.rint(np.real(case_probs[:, 0])).astype(int)]
+    return along_j(disrProbs)
+
+
+# %%
+# Market conditions
+@eq("domestic oil price ($/BBL)")
+def P_d0(P_i0):
+    return P_i0
+
+
+@eq("oil import level (MMBD)")
+def q_i0(q_d0, q_s0):
+    return q_d0 - q_s0
+
+
+@eq("Other NonOPEC Supply (MMBD)")
+def S_NO_0(S_tot, S_OPEC, q_s0):
+    return S_tot - S_OPEC - q_s0
+
+
+@eq("Other NonOPEC Demand (MMBD)")
+def q_DNonUS_0(q_INonUS_0, S_NO_0):
+    return q_INonUS_0 + S_NO_0
+
+
+@eq("Net Import Supply to US (MMBD)")
+def S_iToUS_0(S_OPEC, q_INonUS_0):
+    return S_OPEC - q_INonUS_0
+
+
+@eq("share of GDP spent on oil (Unitless)")
+def sigma_oUS_0(P_i0, q_d0, GDP_0):
+    return P_i0 * (q_d0) * 0.365 / GDP_0
+
+
+@eq("<-Unused-> Share: OPEC Supply as Share of World (Unitless)")
+def sigma_Or(S_OPEC, S_tot):
+    return S_OPEC / S_tot
+
+
+@eq("Fraction of NonUS-NonOPEC demand which is fixed (Unitless)")
+def F_DNO_fixed(sigma_EurNon, Switch_ConstrOECDEurDemand):
+    return sigma_EurNon * Switch_ConstrOECDEurDemand
+
+
+@eq("price slope for SR import supply curve (MMBD/($/BBL))")
+def b_isSR(q_i0, P_i0):
+    n_isr = 0.100  # SR imported oil supply elasticity
+    return n_isr * (q_i0 / P_i0)
+
+
+# %%
+# "alt case" (k) market state: the Ref case (P_d1 None), or the Opt case at the
+# domestic oil price P_d1
+@eq("domestic oil price, alt case ($/BBL)")
+def P_dk(P_d0, P_d1):
+    return P_d0 if P_d1 is None else P_d1
+
+
+@eq("domestic oil demand, alt case (MMBD)")
+def q_dk(q_d0, P_dk, P_d0, n_dlr_adj, P_d1):
+    return q_d0 if P_d1 is None else q_d0 * (P_dk / P_d0) ** n_dlr_adj
+
+
+@eq("domestic oil supply, alt case (MMBD) (note linear approx)")
+def q_sk(q_s0, P_dk, P_d0, dq_s_dP_d, P_d1):
+    return q_s0 if P_d1 is None else q_s0 + (P_dk - P_d0) * dq_s_dP_d
+
+
+@eq("oil imports, alt case (MMBD)")
+def q_ik(q_i0, q_dk, q_sk, P_d1):
+    return q_i0 if P_d1 is None else q_dk - q_sk
+
+
+@eq("import oil price, alt case ($/BBL)")
+def P_ik(P_i0, dP_i_dq_i, q_ik, q_i0, P_d1):
+    return P_i0 if P_d1 is None else P_i0 + dP_i_dq_i * (q_ik - q_i0)
+
+
+@eq("undisrupted GDP, alt case ($bill/yr)")
+def GDP_k(GDP_0):
+    return GDP_0
+
+
+@eq("share of GDP spent on oil, alt case (Unitless)")
+def sigma_oUS_k(sigma_oUS_0, P_ik, q_dk, GDP_0, P_d1):
+    return sigma_oUS_0 if P_d1 is None else P_ik * (q_dk) * 0.365 / GDP_0
+
+
+@eq("LR derivative total (oil&subst) demand w.r.t. import demand (Unitless)")
+def dQ_t_dq_ik(dQ_t_dq_i0, dQ_t_dq_i1, P_d1):
+    return dQ_t_dq_i0 if P_d1 is None else dQ_t_dq_i1
+
+
+@eq("<-Unused-> Implicit tariff ($/BBL)")
+def T_k(P_dk, P_ik):
+    return P_dk - P_ik
+
+
+# %%
+# Elasticities and derivatives
+@eq("(adjusted) LR elas of US oil demand (Unitless)")
+def n_dlr_adj(n_dlr, Switch_DomDem_ElasMult):
+    return n_dlr * Switch_DomDem_ElasMult
+
+
+@eq("Elas:Other NonOPEC Supply (Unitless)")
+def e_SNO(e_SNOr):
+    return e_SNOr
+
+
+@eq("Elas:Other NonOPEC Demand (Unitless)")
+def e_DNO(e_DNOr, F_DNO_fixed):
+    return e_DNOr * (1.0 - F_DNO_fixed)
+
+
+@eq("Elas:NonUS Net Import Demand (Unitless)")
+def e_INonUS(e_DNO, q_DNonUS_0, e_SNO, S_NO_0):
+    return (e_DNO * q_DNonUS_0 - e_SNO * S_NO_0) / (q_DNonUS_0 - S_NO_0)
+
+
+@eq("Elas:OPEC Supply (Unitless)")
+def e_SOPEC(dlnQsodlnP):
+    return dlnQsodlnP
+
+
+@eq("Elas:Net Import Supply to US (Unitless)")
+def e_SNetToUS_0(S_OPEC, e_SOPEC, q_INonUS_0, e_INonUS, S_iToUS_0):
+    return (S_OPEC * e_SOPEC - q_INonUS_0 * e_INonUS) / S_iToUS_0
+
+
+@eq("derivative of inverse import supply curve (($/bbl)/MMBD), Opt same as Ref")
+def dP_i_dq_i(e_SNetToUS_0, q_i0, P_i0):
+    return 1 / (e_SNetToUS_0 * q_i0 / P_i0)
+
+
+@eq("(minus) price slope for SR import demand curve (MMBD/($/BBL))")
+def c_idSR(n_dlr_adj, A_d, q_d0, n_slr, A_s, q_s0, q_i0, P_d0):
+    return -(n_dlr_adj * A_d * q_d0 - n_slr * A_s * q_s0) / q_i0 * (q_i0 / P_d0)
+
+
+@eq("derivative, LR domestic demand for oil (MMBD/($/BBL))")
+def dq_d_dP_dk(n_dlr_adj, q_dk, P_dk):
+    return n_dlr_adj * q_dk / P_dk
+
+
+@eq("derivative, LR domestic supply for oil (MMBD/($/BBL))")
+def dq_s_dP_d(n_slr, q_s0, P_d0):
+    return n_slr * q_s0 / P_d0
+
+
+@eq("derivative, LR domestic inverse import demand curve (($/bbl)/MMBD)")
+def dP_ddq_ik(dq_d_dP_dk, dq_s_dP_d):
+    return 1 / (dq_d_dP_dk - dq_s_dP_d)
+
+
+@eq("work array to calc s.r. derivatives in t4 and t5")
+def D_3k(dQ_t_dq_ik, u_gdp, P_dk, q_dk, dP_ddq_ik):
+    return +dQ_t_dq_ik * (u_gdp / P_dk) - q_dk * (u_gdp / P_dk**2) * dP_ddq_ik
+
+
+@eq("<-Unused-> Elas: SR Elas US Oil dmnd (chk) (Unitless)")
+def Chkn_SRdUS(n_dlr_adj, A_d):
+    return n_dlr_adj * A_d
+
+
+@eq("<-Unused-> Elas: SR Elas US Oil supl (chk) (Unitless)")
+def Chkn_SRsUS(n_slr, A_s):
+    return n_slr * A_s
+
+
+@eq("<-Unused-> Elas: SR Elas of US import dem (computed, info) (Unitless)")
+def e_iu_0(Chkn_SRdUS, q_d0, Chkn_SRsUS, q_s0):
+    return (Chkn_SRdUS * q_d0 - Chkn_SRsUS * q_s0) / (q_d0 - q_s0)
+
+
+@eq("<-Unused-> LR elas of US imports demand (Unitless)")
+def n_ilr0(n_dlr_adj, q_d0, n_slr, q_s0, q_i0):
+    return (n_dlr_adj * q_d0 - n_slr * q_s0) / q_i0
+
+
+# %%
+# Disruption work calculations, (N, J)
+@eq("SPRDraw Rate (MMBD)")
+def S_SPR_j(F_o, DeltaQ_g_j, F_e, F_r, Q_SPR, L_disr):
+    return np.minimum(F_o * DeltaQ_g_j / F_e, +F_r * Q_SPR / (L_disr * 365))
+
+
+@eq("<-Unused-> SPROffset, SPRDraw allocated to US (MMBD)")
+def S_SPRoff_j(S_SPR_j, F_e):
+    return S_SPR_j * F_e
+
+
+@eq("<-Unused-> SPR Draw Total (MMB)")
+def S_TSPR_kj(S_SPR_j, L_disr):
+    return S_SPR_j * 365 * L_disr
+
+
+@eq("Yearly_P (Unitless)")
+def Prob_Yj(Prob10_j):
+    return 1.0 - (1.0 - Prob10_j) ** (1.0 / 10.0)
+
+
+@eq("SR (Disruption) Price Slope (($/bbl)/MMBD)")
+def DelP_Delq_k(b_isSR, c_idSR, q_dk, u_gdp, P_dk):
+    return 1 / (b_isSR + c_idSR + q_dk * u_gdp / P_dk)
+
+
+@eq("DeltaQ, net shortfall to U.S. (MMBD)")
+def DeltaQ_kj(DeltaQ_g_j, S_SPR_j):
+    return DeltaQ_g_j - S_SPR_j
+
+
+@eq("DeltaP, Calc ($/BBL)")
+def DeltaP_kj(DelP_Delq_k, DeltaQ_kj):
+    return DelP_Delq_k * DeltaQ_kj
+
+
+@eq("<-Unused-> Linear GDP Calc ($bill/yr)")
+def GDPl_kj(GDP_k, u_gdp, DeltaP_kj, P_dk):
+    return GDP_k * (1 - u_gdp * DeltaP_kj / P_dk)
+
+
+@eq("Elastic GDP Calc ($bill/yr)")
+def GDPe_kj(GDP_k, DeltaP_kj, P_dk, u_gdp):
+    return GDP_k * ((DeltaP_kj + P_dk) / P_dk) ** (-u_gdp)
+
+
+@eq("SR GNP-shifted import demand (MMBD)")
+def Q_t_kj(q_ik, q_dk, u_gdp, DeltaP_kj, P_dk):
+    return q_ik - q_dk * u_gdp * DeltaP_kj / P_dk
+
+
+@eq("SR import demand (GNP and price effect) (MMBD)")
+def Q_r_kj(Q_t_kj, c_idSR, DeltaP_kj):
+    return Q_t_kj - c_idSR * DeltaP_kj
+
+
+@eq("Derivative, DeltaP w.r.t. undisr imports (($/bbl)/MMBD)")
+def dDelPdqi_kj(DeltaQ_kj, DeltaP_kj, D_3k, dEDelQ_dq_i):
+    return -DeltaQ_kj * (DeltaP_kj / DeltaQ_kj) ** 2 * D_3k + dEDelQ_dq_i * (
+        DeltaP_kj / DeltaQ_kj
+    )
+
+
+@eq("Derivative, SR GNP_shifted demand w.r.t. undisr imports (Unitless)")
+def dQ_tdq_i_kj(dQ_t_dq_ik, u_gdp, DeltaP_kj, P_dk, q_dk, dDelPdqi_kj, dP_ddq_ik):
+    return (
+        1
+        - dQ_t_dq_ik * u_gdp * DeltaP_kj / P_dk
+        - q_dk * u_gdp * dDelPdqi_kj / P_dk
+        + q_dk * u_gdp * DeltaP_kj * dP_ddq_ik / P_dk**2
+    )
+
+
+@eq("Derivative, SR imp supply w.r.t. undisr imports (Unitless)")
+def dQ_udq_i_kj(dQ_tdq_i_kj, c_idSR, dDelPdqi_kj):
+    return dQ_tdq_i_kj - c_idSR * dDelPdqi_kj
+
+
+@eq("MCdis_vul_monops_kj ($/BBL)")
+def MCdis_vul_monops_kj(Q_t_kj, Q_r_kj, dP_ddq_ik, dP_i_dq_i):
+    return +(Q_t_kj - Q_r_kj) * (dP_ddq_ik - dP_i_dq_i)
+
+
+@eq("MCdis_vul_dGDP_kj ($/BBL)")
+def MCdis_vul_dGDP_kj(u_gdp, GDPe_kj, DeltaP_kj, dP_ddq_ik, P_dk):
+    return -u_gdp * GDPe_kj * DeltaP_kj * dP_ddq_ik / P_dk**2
+
+
+@eq("MCdis_vul_dDWL_kj ($/BBL)")
+def MCdis_vul_dDWL_kj(DeltaP_kj, dQ_tdq_i_kj, dQ_udq_i_kj):
+    return 0.5 * DeltaP_kj * (dQ_tdq_i_kj - dQ_udq_i_kj)
+
+
+@eq("MCdis_vul_dFC_kj ($/BBL)")
+def MCdis_vul_dFC_kj(DeltaP_kj, dQ_udq_i_kj, Rho_E):
+    return DeltaP_kj * (dQ_udq_i_kj - Rho_E)
+
+
+@eq("MCdis_size_dSSdDWL_kj ($/BBL)")
+def MCdis_size_dSSdDWL_kj(Q_t_kj, Q_r_kj, dDelPdqi_kj):
+    return 0.5 * (Q_t_kj - Q_r_kj) * dDelPdqi_kj
+
+
+@eq("MCdis_size_dFC_kj ($/BBL)")
+def MCdis_size_dFC_kj(Q_r_kj, dDelPdqi_kj):
+    return Q_r_kj * dDelPdqi_kj
+
+
+@eq("MCdis_size_dGNPdDelP_kj ($/BBL)")
+def MCdis_size_dGNPdDelP_kj(u_gdp, GDPe_kj, P_dk, dDelPdqi_kj):
+    return (u_gdp * GDPe_kj / P_dk) * dDelPdqi_kj
+
+
+@eq("<-Unused-> MCdis_vul_kj ($/BBL)")
+def MCdis_vul_kj(
+    MCdis_vul_monops_kj, MCdis_vul_dGDP_kj, MCdis_vul_dDWL_kj, MCdis_vul_dFC_kj
+):
+    return (
+        MCdis_vul_monops_kj + MCdis_vul_dGDP_kj + MCdis_vul_dDWL_kj + MCdis_vul_dFC_kj
+    )
+
+
+@eq("<-Unused-> MCdis_size_kj ($/BBL)")
+def MCdis_size_kj(MCdis_size_dSSdDWL_kj, MCdis_size_dFC_kj, MCdis_size_dGNPdDelP_kj):
+    return MCdis_size_dSSdDWL_kj + MCdis_size_dFC_kj + MCdis_size_dGNPdDelP_kj
+
+
+@eq("<-Unused-> Test Sum, Prob_weighted MCdis_vul_kj ($/BBL)")
+def pMCdis_x1_4(Prob_Yj, MCdis_vul_kj):
+    return Prob_Yj * MCdis_vul_kj
+
+
+@eq("<-Unused-> Test Sum, Prob_weighted MCdis_size_kj ($/BBL)")
+def pMCdis_x5_7(Prob_Yj, MCdis_size_kj):
+    return Prob_Yj * MCdis_size_kj
+
+
+@eq("Weighting factor (Unitless)")
+def w_kj(Prob_Yj, dQ_tdq_i_kj, dQ_udq_i_kj):
+    return Prob_Yj * (dQ_tdq_i_kj - dQ_udq_i_kj)
+
+
+@eq("Prob_weighted price Increase ($/BBL)")
+def PrDeltaP_kj(Prob_Yj, DeltaP_kj):
+    return Prob_Yj * DeltaP_kj
+
+
+@eq("<-Unused-> Prob_weighted DeltaQ (MMBD)")
+def E_DeltaQ_kj(DeltaQ_kj, Prob_Yj):
+    return DeltaQ_kj * Prob_Yj
+
+
+@eq("<-Unused-> Prob_weighted DeltaP ($/BBL)")
+def E_DeltaP_kj(DeltaP_kj, Prob_Yj):
+    return DeltaP_kj * Prob_Yj
+
+
+@eq("<-Unused-> Prob_weighted DeltaGDP (linear, GDP_0 - GDPl) ($bill/yr)")
+def E_DeltaGDPl_kj(GDP_0, GDPl_kj, Prob_Yj):
+    return (GDP_0 - GDPl_kj) * Prob_Yj
+
+
+@eq("<-Unused-> Prob_weighted DeltaGDP (elastic, GDP_0 - GDPe) ($bill/yr)")
+def E_DeltaGDPe_kj(GDP_0, GDPe_kj, Prob_Yj):
+    return (GDP_0 - GDPe_kj) * Prob_Yj
+
+
+@eq("<-Unused-> Inverse Import Supply (Price) Slope (($/bbl)/MMBD)")
+def DeltaP_over_DeltaQ(DeltaP_kj, DeltaQ_kj):
+    return DeltaP_kj / DeltaQ_kj
+
+
+# %%
+# Final calculations: reductions over j, each (N, 1): the sums over j (`j_sums`),
+# then the values computed from them
+@eq("Sum over j, Weighting factor (Unitless)")
+def sum_w_kj(w_kj):
+    return np.sum(w_kj, 1, keepdims=True)
+
+
+@eq("Expected disruption price increase ($/BBL)")
+def EDelP_k(PrDeltaP_kj):
+    return np.sum(PrDeltaP_kj, 1, keepdims=True)
+
+
+@eq("Sum over j, Prob_weighted MCdis_vul_monops_kj ($/BBL)")
+def sum_MCdis_vul_monops_kj(Prob_Yj, MCdis_vul_monops_kj):
+    return np.sum(Prob_Yj * MCdis_vul_monops_kj, 1, keepdims=True)
+
+
+@eq("Sum over j, Prob_weighted MCdis_vul_dGDP_kj ($/BBL)")
+def sum_MCdis_vul_dGDP_kj(Prob_Yj, MCdis_vul_dGDP_kj):
+    return np.sum(Prob_Yj * MCdis_vul_dGDP_kj, 1, keepdims=True)
+
+
+@eq("Sum over j, Prob_weighted MCdis_vul_dDWL_kj ($/BBL)")
+def sum_MCdis_vul_dDWL_kj(Prob_Yj, MCdis_vul_dDWL_kj):
+    return np.sum(Prob_Yj * MCdis_vul_dDWL_kj, 1, keepdims=True)
+
+
+@eq("Sum over j, Prob_weighted MCdis_vul_dFC_kj ($/BBL)")
+def sum_MCdis_vul_dFC_kj(Prob_Yj, MCdis_vul_dFC_kj):
+    return np.sum(Prob_Yj * MCdis_vul_dFC_kj, 1, keepdims=True)
+
+
+@eq("Sum over j, Prob_weighted MCdis_size_dSSdDWL_kj ($/BBL)")
+def sum_MCdis_size_dSSdDWL_kj(Prob_Yj, MCdis_size_dSSdDWL_kj):
+    return np.sum(Prob_Yj * MCdis_size_dSSdDWL_kj, 1, keepdims=True)
+
+
+@eq("Sum over j, Prob_weighted MCdis_size_dFC_kj ($/BBL)")
+def sum_MCdis_size_dFC_kj(Prob_Yj, MCdis_size_dFC_kj):
+    return np.sum(Prob_Yj * MCdis_size_dFC_kj, 1, keepdims=True)
+
+
+@eq("Sum over j, Prob_weighted MCdis_size_dGNPdDelP_kj ($/BBL)")
+def sum_MCdis_size_dGNPdDelP_kj(Prob_Yj, MCdis_size_dGNPdDelP_kj):
+    return np.sum(Prob_Yj * MCdis_size_dGNPdDelP_kj, 1, keepdims=True)
+
+
+@eq("scale factor for tariff loss during Disruption (Unitless)")
+def w_k(sum_w_kj):
+    return 1 - sum_w_kj
+
+
+@eq("SR Disr monoposony effect ($/BBL)")
+def E_MCdis_vul_monops_k(sum_MCdis_vul_monops_kj, w_k):
+    return sum_MCdis_vul_monops_kj / w_k
+
+
+@eq("SR Disr marginal effect on GDP loss ($/BBL)")
+def E_MCdis_vul_dGDP_k(sum_MCdis_vul_dGDP_kj, w_k):
+    return sum_MCdis_vul_dGDP_kj / w_k
+
+
+@eq("SR Disr marginal effect on DWL ($/BBL)")
+def E_MCdis_vul_dDWL_k(sum_MCdis_vul_dDWL_kj, w_k):
+    return sum_MCdis_vul_dDWL_kj / w_k
+
+
+@eq("SR Disr marginal effect on Foreign Claims ($/BBL)")
+def E_MCdis_vul_dFC_k(sum_MCdis_vul_dFC_kj, w_k):
+    return sum_MCdis_vul_dFC_kj / w_k
+
+
+@eq("SR Disr marginal effect: demand on GDP sensitivity ($/BBL)")
+def E_MCdis_vul_deGDP_k(EDelP_k, u_gdp, sigma_oUS_k):
+    return EDelP_k * (u_gdp / sigma_oUS_k)
+
+
+@eq("SR Disr marg effect of size on DWL ($/BBL)")
+def E_MCdis_size_dSSdDWL_k(sum_MCdis_size_dSSdDWL_kj, w_k):
+    return sum_MCdis_size_dSSdDWL_kj / w_k
+
+
+@eq("SR Disr marg effect of size on Foreign Claims ($/BBL)")
+def E_MCdis_size_dFC_k(sum_MCdis_size_dFC_kj, w_k):
+    return sum_MCdis_size_dFC_kj / w_k
+
+
+@eq("SR Disr marg effect of size on GDP loss ($/BBL)")
+def E_MCdis_size_dGNPdDelP_k(sum_MCdis_size_dGNPdDelP_kj, w_k):
+    return sum_MCdis_size_dGNPdDelP_kj / w_k
+
+
+@eq("<-Unused-> SR Dist marg effect on vulnerability costs ($/BBL)")
+def E_MCdis_vul_k(
+    E_MCdis_vul_monops_k, E_MCdis_vul_dGDP_k, E_MCdis_vul_dDWL_k, E_MCdis_vul_dFC_k
+):
+    return (
+        E_MCdis_vul_monops_k
+        + E_MCdis_vul_dGDP_k
+        + E_MCdis_vul_dDWL_k
+        + E_MCdis_vul_dFC_k
+    )
+
+
+@eq("<-Unused-> SR Disr marg effect of size on vuln costs ($/BBL)")
+def E_MCdis_size_k(
+    E_MCdis_size_dSSdDWL_k, E_MCdis_size_dFC_k, E_MCdis_size_dGNPdDelP_k
+):
+    return E_MCdis_size_dSSdDWL_k + E_MCdis_size_dFC_k + E_MCdis_size_dGNPdDelP_k
+
+
+@eq("Monopsony Premium ($/BBL)")
+def MCmonopsony_k(dP_i_dq_i, q_ik, w_k):
+    return dP_i_dq_i * q_ik / w_k
+
+
+@eq("BOP Premium ($/BBL)")
+def MCbop_k(P_ik, w_k):
+    n_pe = -1.0  # elasticity of oil import price w.r.t. exchange rate
+    n_eqk = 0  # price elas of exchange rate w.r.t. oil import price (Unitless)
+    return P_ik * n_pe * n_eqk / w_k
+
+
+@eq("LR premium: monopsony, BOP, inflation and potential output ($/BBL)")
+def MCLR_k(MCmonopsony_k, MCbop_k):
+    MCinf_k = 0  # Infl Premium ($/BBL)
+    MClr_pot_k = 0.0  # LR Potential Output Premium ($/BBL)
+    return MCmonopsony_k + MCbop_k + MCinf_k + MClr_pot_k
+
+
+@eq("<-Unused-> Check: Monopsony Premium pi_m via elasticity ($/BBL)")
+def Chk_pi_m_elas(P_ik, e_SNetToUS_0):
+    return P_ik / e_SNetToUS_0
+
+
+@eq("<-Unused-> Check: Monopsony Premium pi_m via price slope ($/BBL)")
+def Chk_pi_m_slope(q_ik, dP_i_dq_i):
+    return q_ik * dP_i_dq_i
+
+
+# %%
+# Summary results
+@eq("MonopsonyPremium (Cartel Rent) ($/BBL)")
+def pi_m(MCLR_k):
+    return MCLR_k
+
+
+@eq("Disruption: Internalized ($/BBL)")
+def pi_di(E_MCdis_vul_dFC_k, E_MCdis_vul_monops_k, E_MCdis_size_dFC_k):
+    return E_MCdis_vul_dFC_k + E_MCdis_vul_monops_k + E_MCdis_size_dFC_k
+
+
+@eq("Disruption: Macroeconomic ($/BBL)")
+def pi_dm(
+    E_MCdis_vul_dGDP_k,
+    E_MCdis_vul_dDWL_k,
+    E_MCdis_size_dSSdDWL_k,
+    E_MCdis_size_dGNPdDelP_k,
+):
+    return (
+        E_MCdis_vul_dGDP_k
+        + E_MCdis_vul_dDWL_k
+        + E_MCdis_size_dSSdDWL_k
+        + E_MCdis_size_dGNPdDelP_k
+    )
+
+
+@eq("Disruption: Total ($/BBL)")
+def pi_d(pi_dm, pi_di):
+    return pi_dm + pi_di
+
+
+@eq("Total ($/BBL)")
+def pi_tot(pi_m, pi_d):
+    return pi_m + pi_d
+
+
+# %%
+def as_columns(values, outputs, num_samples):
+    """N x len(outputs) array of `values`, variables along j summed"""
+    dtype = np.result_type(*[values[name] for name in outputs])
+    out = np.empty((num_samples, len(outputs)), dtype=dtype)
+    for c, name in enumerate(outputs):
+        x = np.asarray(values[name])
+        out[:, c : c + 1] = (
+            x if x.ndim == 2 and x.shape[1] == 1 else np.sum(x, 1, keepdims=True)
+        )
+    return out
+
+
+# %%
+class Session:
+    """Inputs and computed values of the model for one set of samples, kept between
+    evaluations so that changing some inputs recomputes only what depends on them
+
+    inputs -- dict of input values, as returned by `OIP.batch_inputs`\n
+    graph -- `EquationGraph` to evaluate (default = `model`)\n
+    Intermediate arrays are kept for every variable computed (about 8 bytes x N x J
+    each), the price of not recomputing them.
+    """
+
+    def __init__(self, inputs, graph=None):
+        self.graph = model if graph is None else graph
+        self.inputs = dict(inputs)
+        self.values = {}
+        self.last_computed = []  # equations evaluated by the last `evaluate`
+
+    @property
+    def num_samples(self):
+        return len(self.inputs["u_gdp"])
+
+    def evaluate(self, outputs=None):
+        """return N x len(outputs) array of `outputs` (default = `pi_components`),
+        computing only the variables not already known
+        """
+        if outputs is None:
+            outputs = pi_components
+        known = set(self.values)
+        self.graph.evaluate(outputs, self.inputs, self.values)
+        self.last_computed = self.graph.order(outputs, known)
+        return as_columns(
+            {n: self.values.get(n, self.inputs.get(n)) for n in outputs},
+            outputs,
+            self.num_samples,
+        )
+
+    def update(self, **changes):
+        """change inputs by name and drop the computed values depending on them, e.g.
+        `case_oilmkt` (the market data gathered by it) or `disrProbs`
+
+        return set of the variables invalidated
+        """
+        names = []
+        for name, value in changes.items():
+            if name in self.graph.equations:
+                raise ValueError("%s is computed, not an input" % name)
+            if name not in self.inputs:
+                raise KeyError(name)
+            self.inputs[name] = value
+            names.append(name)
+        stale = self.graph.dependents(names)
+        for name in stale:
+            self.values.pop(name, None)
+        return stale
+
+
+# %%
+class Reweighting:
+    """Premium components of one sample set for many disruption probability vectors
+
+    The sums over disruption sizes j (`j_sums`) are the only variables depending on
+    the probabilities, which enter them only as weights `Prob_Yj` of per-size terms:
+    the terms are computed once (over chunks of j), and each probability vector
+    then costs a few matrix-vector products, and the model equations from the sums
+    on (`w_k`, `E_MCdis_*_k`, `MCLR_k`, ...).
+
+    inputs -- dict of input values, as returned by `OIP.batch_inputs` (`disrProbs` unused)\n
+    chunk_cells -- samples x sizes per chunk of the per-size calculations (default =
+    1 << 20, as `OIP.disr_chunk_cells`)\n
+    Holds N x J floats per term of `j_sums`: chunk the samples for large N x J.
+    """
+
+    def __init__(self, inputs, chunk_cells=1 << 20):
+        self.inputs = inputs
+        terms = list(j_sums.values())
+        known = set(j_sums) | {"Prob_Yj"}
+        needed = model.order(pi_components + terms, known)
+        if "Prob10_j" in needed:
+            raise ValueError("reweighted terms depend on the disruption probabilities")
+        along = model.dependents(["DeltaQ_g_j"])
+        final = model.dependents(j_sums)
+        # the variables depending on neither sizes nor probabilities, computed once
+        self.values = model.evaluate(
+            [n for n in needed if n not in along and n not in final],
+            inputs,
+            {"Prob_Yj": 1.0},
+        )
+        DeltaQ_g_j = model.evaluate(["DeltaQ_g_j"], inputs, self.values)["DeltaQ_g_j"]
+        num_samples = len(inputs["u_gdp"])
+        num_sizes = DeltaQ_g_j.shape[1]
+        chunk = max(1, chunk_cells // max(num_samples, 1))
+        self.terms = np.empty((len(terms), num_samples, num_sizes))
+        for j0 in range(0, num_sizes, chunk):
+            part = dict(self.values)
+            part["DeltaQ_g_j"] = DeltaQ_g_j[:, j0 : j0 + chunk]
+            model.evaluate(terms, inputs, part)
+            for t, name in enumerate(terms):
+                self.terms[t, :, j0 : j0 + chunk] = part[name]
+
+    def _premiums(self, sums):
+        """premium components from the values of `j_sums`, on a last axis (a view)"""
+        values = dict(self.values)
+        values.update(zip(j_sums, sums[..., np.newaxis]))
+        model.evaluate(pi_components, self.inputs, values)
+        shape = np.broadcast_shapes(*[np.shape(values[n]) for n in pi_components])
+        out = np.empty((len(pi_components),) + shape[:-1])
+        for c, name in enumerate(pi_components):
+            out[c] = values[name][..., 0]
+        return np.moveaxis(out, 0, -1)
+
+    def evaluate(self, disrProbs):
+        """premium components for decadal disruption probabilities `disrProbs`
+
+        disrProbs -- length J, or N x J for a set per sample (as `OIP.eval_cases_batch`)\n
+        return numpy array N x 14 (columns as `pi_components`)
+        """
+        weights = Prob_Yj(along_j(disrProbs))  # (1 or N, J)
+        return self._premiums(np.sum(self.terms * weights, 2))
+
+    def evaluate_sets(self, prob_sets):
+        """premium components for each of K vectors of decadal disruption probabilities
+
+        prob_sets -- K x J array, a probability vector per row\n
+        return numpy array K x N x 14 (a view of a 14 x K x N array)
+        """
+        weights = Prob_Yj(np.atleast_2d(prob_sets))  # (K, J)
+        return self._premiums(np.matmul(weights, self.terms.transpose(0, 2, 1)))
@@ -3,114 +3,119 @@
 rand_dists_added.py
 Additional random functions needed to replicate some distributions previously used
 """
+import warnings
+
 import numpy
+from scipy.stats import qmc  # Latin Hypercube and Sobol designs
+
+# All samplers draw from `rng`, a numpy.random.Generator, if given, and otherwise
+# from the global numpy.random state. Each inverts a cumulative distribution
+# (searchsorted for discrete values, interp for a piecewise linear CDF) over a
+# whole array of uniform draws, with no per-sample or per-bin Python loops.
+
+def _uniform(count, rng=None):
+    """return "count" uniform random values over 0 to 1.0, from rng or the global state"""
+    if rng is None:
+        return numpy.random.random(count)
+    return rng.random(count)
+
+def discrete_cdf(probs=[]):
+    """cumulative probabilities of a discrete distribution, with the last one set to 1.0"""
+    cprobs = numpy.cumsum(numpy.asarray(probs, dtype=float))
+    cprobs[-1] = 1.0    # make sure of this.
+    return(cprobs)
+
+def discrete_from_uniform(urv, xvals=[], cprobs=[]):
+    """map uniform values urv (0 to 1.0) to discrete values: xvals[n] for cprobs[n-1] < urv <= cprobs[n]"""
+    return numpy.asarray(xvals, dtype=float)[numpy.searchsorted(cprobs, urv)]
+
+def cumul_from_uniform(urv, XLowBnd, XUpBnd, CumProbList=[], XList=[]):
+    """map uniform values urv (0 to 1.0) through the inverse of a piecewise linear CDF"""
+    xvals = numpy.concatenate([[XLowBnd], XList, [XUpBnd]]).astype(float)
+    cprobs = numpy.concatenate([[0.0], CumProbList, [1.0]]).astype(float)
+    return numpy.interp(urv, cprobs, xvals)
 
-# Note: there are likely to be faster library functions for discrete random samples
-def risk_discrete(xvals=[],probs=[],count=1):
+def triangular_from_uniform(urv, XLowBnd, XMode, XUpBnd):
+    """map uniform values urv (0 to 1.0) through the inverse CDF of a triangular distribution"""
+    urv = numpy.asarray(urv, dtype=float)
+    if (XLowBnd>=XUpBnd):
+        return(numpy.ones(urv.shape)*XLowBnd)
+    fmode = (XMode-XLowBnd)/(XUpBnd-XLowBnd)    # CDF at the mode
+    return numpy.where(urv <= fmode,
+                       XLowBnd + numpy.sqrt(urv*(XUpBnd-XLowBnd)*(XMode-XLowBnd)),
+                       XUpBnd - numpy.sqrt((1.0-urv)*(XUpBnd-XLowBnd)*(XUpBnd-XMode)))
+
+def uniform_design(count, dims, method="mc", rng=None, antithetic=False):
+    """generate a "count" x "dims" array of uniform values over 0 to 1.0, one column per variable.\n
+       method -- "mc" (independent pseudo-random), "lhs" (Latin Hypercube: each column
+                 stratified in "count" equal bins) or "sobol" (scrambled Sobol low-discrepancy
+                 sequence, best with "count" a power of 2)\n
+       rng -- optional numpy.random.Generator (default: seeded from global numpy.random state)\n
+       antithetic -- if True, rows come in antithetic pairs (u, 1-u): rows 2i and 2i+1
+    """
+    if antithetic:
+        half = uniform_design((count+1)//2, dims, method, rng)
+        return numpy.stack([half, 1.0-half], axis=1).reshape(-1, dims)[:count]
+    if method == "mc":
+        return _uniform(count*dims, rng).reshape(count, dims)
+    if rng is None:
+        rng = numpy.random.default_rng(numpy.random.randint(2**31))
+    if method == "lhs":
+        return qmc.LatinHypercube(d=dims, seed=rng).random(count)
+    if method == "sobol":
+        with warnings.catch_warnings():    # balance warning if count not a power of 2, as
+            # for the last, partial shard of a run (default shard sizes are powers of 2)
+            warnings.simplefilter("ignore", UserWarning)
+            return qmc.Sobol(d=dims, scramble=True, seed=rng).random(count)
+    raise ValueError("unknown sampling method: %s" % method)
+
+def risk_discrete(xvals=[],probs=[],count=1,rng=None):
     """generate values from the enumerated elements of a discrete distribution.\n
        probs and xvals are lists of discrete probabilities and values.\n
-       Expect sum of probs should be 1.0, len(prob)==len(xvals)  
-       Return a randomly sampled value from xvals
+       Expect sum of probs should be 1.0, len(prob)==len(xvals)\n
+       rng -- optional numpy.random.Generator (default: global numpy.random state)
+       Return "count" randomly sampled values from xvals
     """
-    urv = numpy.random.random(count)    # a numpy array of uniform rvs over 0 to 1.0
-    rv = numpy.ones(count)*numpy.NaN    # random values to be returned, init to NaN
-    if count<len(xvals):    # sample small
-        for m in range(count):    # loop over possible xvals
-            cprob = 0.0
-            for n in range(len(xvals)):
-                cprob += probs[n]
-                if urv[m] <= cprob:
-                    rv[m] = xvals[n]
-                    break
-    else:    # sample is large compared to number of discrete alternative
-        cprob = 0.0
-        cprobs = []
-        for n in range(len(xvals)):
-            cprob += probs[n]
-            cprobs.append(cprob)
-        cprobs[-1]=1.0    # make sure of this.
-        test1 = urv>0.0
-        for n in range(len(xvals)):
-            test2 = urv<=cprobs[n]
-            test1 = test1 * test2    # above last and below next bound?
-            rv[test1] = xvals[n]    # assign matching value for bin
-            test1 = ~test2        # this is array negation, unlike "not"
-    return(rv)
-
-def risk_triangular(XLowBnd,XMode,XUpBnd,count=1):
+    urv = _uniform(count, rng)    # a numpy array of uniform rvs over 0 to 1.0
+    return discrete_from_uniform(urv, xvals, discrete_cdf(probs))
+
+def risk_triangular(XLowBnd,XMode,XUpBnd,count=1,rng=None):
     """generate values from a triangular distribution.\n
        Expect XLowBnd <= XMode <= XUpBnd.\n
+       rng -- optional numpy.random.Generator (default: global numpy.random state)
        Returns "count" randomly sampled values between XlowBnd and XUpBnd.
     """
     if (XLowBnd>=XUpBnd):
         return(numpy.ones(count)*XLowBnd)
-    else:
+    elif rng is None:
         return numpy.random.triangular(XLowBnd,XMode,XUpBnd,count)
+    else:
+        return rng.triangular(XLowBnd,XMode,XUpBnd,count)
 
-def risk_rtriangular(XUpBnd,XMode,XLowBnd,count=1):
+def risk_rtriangular(XUpBnd,XMode,XLowBnd,count=1,rng=None):
     """generate values from a triangular distribution.\n
        (Triangle parameters in reverse order (XUpBnd, XMode, XLowBnd, count)).\n
        Expect XLowBnd <= XMode <= XUpBnd.\n
+       rng -- optional numpy.random.Generator (default: global numpy.random state)
        Returns "count" randomly sampled values between XlowBnd and XUpBnd.
     """
-    if (XLowBnd>=XUpBnd):
-        return(numpy.ones(count)*XLowBnd)
-    else:
-        return numpy.random.triangular(XLowBnd,XMode,XUpBnd,count)    
-    
-def risk_cumul(XLowBnd,XUpBnd,CumProbList=[],XList=[],count=1,debug=False):
+    return risk_triangular(XLowBnd,XMode,XUpBnd,count,rng)
+
+def risk_cumul(XLowBnd,XUpBnd,CumProbList=[],XList=[],count=1,debug=False,rng=None):
     """generate values sampled from the distribution specified as a piecewise
        linear CDF.\n
        XList and CumProbList are lists of values and corresponding cumulative probabilities.
        CDF is assumed linear between specified points.
        Expect CumProbList probs in increasing order, each >0 and <1.0
+       rng -- optional numpy.random.Generator (default: global numpy.random state)
        Returns "count" randomly sampled values between XlowBnd and XUpBnd.
     """
-    xvals = numpy.array([XLowBnd]+XList+[XUpBnd])
-    cprobs = numpy.array([0.0]+CumProbList+[1.0])
-    urv = numpy.random.random(count)    # a numpy array of uniform rvs over 0 to 1.0
+    urv = _uniform(count, rng)    # a numpy array of uniform rvs over 0 to 1.0
     if debug:
-        print("xvals: ",xvals)
-        print("cprobs: ", cprobs)
+        print("xvals: ",[XLowBnd]+list(XList)+[XUpBnd])
+        print("cprobs: ",[0.0]+list(CumProbList)+[1.0])
         print("urv: ",urv)
-    rv = numpy.ones(count)*numpy.NaN
-    if count< 2: #len(xvals):
-        for m in range(count):    # loop over each sample
-            x_previous = xvals[0]
-            cp_previous = 0.0
-            for n in range(len(xvals))[1:]:
-                if urv[m] <= cprobs[n]:
-                    if debug:
-                        print("urv[m]", urv[m], "n", n, "cprobs[n]", cprobs[n])
-                        print("x_previous", x_previous, "cp_previous", cp_previous)
-                        if urv[m] <= cprobs[1]:
-                            print(m,urv[m])
-                    rv[m] = x_previous + (xvals[n]-x_previous)*(urv[m]-cp_previous)/(cprobs[n]-cp_previous)
-                    break
-                else:
-                    x_previous = xvals[n]
-                    cp_previous = cprobs[n]
-            # NOT NEEDED: rv[m] = xvals[-1]    # default is to return the last value
-    else:    # sample is large compared to number of discrete alternative
-        rvbins = numpy.ones(count,dtype=numpy.int)    # array of indices must be of type intarray
-        bslope = numpy.zeros(len(xvals))
-        bbase = numpy.zeros(len(xvals))
-        for n in range(len(xvals))[1:]:    # start with second prob, since first constructed to be zero
-            bslope[n] = (xvals[n]-xvals[n-1])/(cprobs[n]-cprobs[n-1])
-            bbase[n] = xvals[n-1] - cprobs[n-1]*bslope[n]
-        test1 = urv>0.0    # an array of booleans. Assume cprobs[0]=0.0.
-        rv[~test1] = xvals[0]            # deal with rare/impossible boundary rv
-        for n in range(len(xvals))[1:]:    # start with second prob, since first constructed to be zero
-            test2 = urv<=cprobs[n]
-            test1 = test1 * test2    # in this bin if above last and below this bound
-            rvbins[test1] = n
-            # assign value for cases in this bin 
-            # WARNING: possibility of zero-probability-width bin leading to divide by zero?  but should have no observations
-            # rv[test1] = xvals[n-1] + (xvals[n]-xvals[n-1])*(urv-cprobs[n-1])/(cprobs[n]-cprobs[n-1])
-            test1 = ~test2        # this is array negation, unlike "not"
-        if debug: print("rvbins",rvbins)
-        rv = bbase[rvbins] + urv*bslope[rvbins]    # use trick indexing by integers arrays
-    return(rv)
+    return cumul_from_uniform(urv, XLowBnd, XUpBnd, CumProbList, XList)
 
 risk_function_dict = {
 "risk_triangular":    risk_triangular,
@@ -119,3 +124,26 @@ risk_function_dict = {
 "risk_cumul":         risk_cumul,
 }
 
+# inverse CDFs, each taking an array of uniform values followed by the same
+# distribution parameters as the corresponding function in risk_function_dict
+inverse_cdf_dict = {
+"risk_triangular":    triangular_from_uniform,
+"risk_rtriangular":   lambda urv,XUpBnd,XMode,XLowBnd: triangular_from_uniform(urv,XLowBnd,XMode,XUpBnd),
+"risk_discrete":      lambda urv,xvals,probs: discrete_from_uniform(urv,xvals,discrete_cdf(probs)),
+"risk_cumul":         cumul_from_uniform,
+}
+
+# exact means, each taking the same distribution parameters as the
+# corresponding function in risk_function_dict (e.g. for control variates)
+def cumul_mean(XLowBnd, XUpBnd, CumProbList=[], XList=[]):
+    """mean of the distribution with a piecewise linear CDF: probability-weighted bin midpoints"""
+    xvals = numpy.concatenate([[XLowBnd], XList, [XUpBnd]]).astype(float)
+    cprobs = numpy.concatenate([[0.0], CumProbList, [1.0]]).astype(float)
+    return numpy.sum(numpy.diff(cprobs)*(xvals[1:]+xvals[:-1])/2.0)
+
+mean_dict = {
+"risk_triangular":    lambda XLowBnd,XMode,XUpBnd: (XLowBnd+XMode+XUpBnd)/3.0,
+"risk_rtriangular":   lambda XUpBnd,XMode,XLowBnd: (XLowBnd+XMode+XUpBnd)/3.0,
+"risk_discrete":      lambda xvals,probs: numpy.dot(numpy.diff(discrete_cdf(probs),prepend=0.0),xvals),
+"risk_cumul":         cumul_mean,
+}
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+results_store.py
+On-disk store of OIP simulation results, one memory-mapped .npy file per year,
+readable by year and component without loading the rest of a run.
+
+    <path>/index.json            years, component names, stat names, sample counts
+    <path>/samples_<year>.npy    components x samples (each component contiguous)
+    <path>/stats_<year>.npy      stats x components
+"""
+import json
+import os
+
+import numpy as np
+
+
+class ResultsStore:
+    """Directory of per-year sample and statistics arrays, with a JSON index
+
+    path -- store directory\n
+    mode -- "r" to read an existing store (arrays opened read-only, memory-mapped),
+            "w" to create or add to one (default = "r")\n
+    component_names, stat_names -- names of result columns and statistic rows,
+            required when creating a new store
+    """
+
+    def __init__(self, path, mode="r", component_names=None, stat_names=None):
+        self.path = path
+        self.mode = mode
+        index_file = os.path.join(path, "index.json")
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                self.index = json.load(f)
+        elif mode == "w":
+            if component_names is None or stat_names is None:
+                raise ValueError("new store needs component_names and stat_names")
+            os.makedirs(path, exist_ok=True)
+            self.index = {
+                "years": [],
+                "component_names": list(component_names),
+                "stat_names": list(stat_names),
+                "num_samples": {},
+            }
+            self._write_index()
+        else:
+            raise FileNotFoundError(index_file)
+
+    # ---------------------------------------------------------------------
+    @property
+    def years(self):
+        return list(self.index["years"])
+
+    @property
+    def component_names(self):
+        return list(self.index["component_names"])
+
+    @property
+    def stat_names(self):
+        return list(self.index["stat_names"])
+
+    def _file(self, kind, year):
+        return os.path.join(self.path, "%s_%d.npy" % (kind, year))
+
+    def _write_index(self):
+        tmp = os.path.join(self.path, "index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, "index.json"))
+
+    # ---------------------------------------------------------------------
+    def write_year(self, year, samples=None, stats=None):
+        """store the results of one year
+
+        samples -- optional array (num_samples x components) of sample results
+        stats -- optional array (stats x components) of summary statistics
+        """
+        if self.mode != "w":
+            raise IOError("results store %s opened read-only" % self.path)
+        year = int(year)
+        if samples is not None:
+            samples = np.asarray(samples, dtype=float)
+            mm = np.lib.format.open_memmap(
+                self._file("samples", year),
+                mode="w+",
+                dtype=float,
+                shape=(samples.shape[1], samples.shape[0]),
+            )
+            mm[:] = samples.T  # component-major, so each component is contiguous
+            mm.flush()
+            del mm
+            self.index["num_samples"][str(year)] = samples.shape[0]
+        if stats is not None:
+            np.save(self._file("stats", year), np.asarray(stats, dtype=float))
+        if year not in self.index["years"]:
+            self.index["years"] = sorted(self.index["years"] + [year])
+        self._write_index()
+
+    def has_samples(self, year):
+        return str(int(year)) in self.index["num_samples"]
+
+    def samples(self, year, component=None):
+        """memory-mapped sample results of `year`
+
+        component -- optional component name: return only its samples (a 1-d view)
+        return array (num_samples) for one component, else (num_samples x components)
+        """
+        mm = np.load(self._file("samples", int(year)), mmap_mode="r")
+        if component is None:
+            return mm.T
+        return mm[self.index["component_names"].index(component)]
+
+    def stats(self, year=None, stat=None, component=None):
+        """summary statistics, for one year or (if year is None) across all years
+
+        stat, component -- optional stat name / component name to select
+        return array with dims (years,) stats, components, dropping those selected
+        """
+        years = self.index["years"] if year is None else [int(year)]
+        ndx = (
+            slice(None) if stat is None else self.index["stat_names"].index(stat),
+            (
+                slice(None)
+                if component is None
+                else self.index["component_names"].index(component)
+            ),
+        )
+        out = np.array(
+            [np.load(self._file("stats", y), mmap_mode="r")[ndx] for y in years]
+        )
+        return out if year is None else out[0]
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+run_checkpoint.py
+Checkpoint of a multi-year simulation run: the results of each completed shard of
+samples are saved as they finish, so an interrupted run resumes where it stopped.
+
+    <path>/index.json               run settings and random streams (written once)
+    <path>/shards.log               "<year> <first>" line of each shard completed
+    <path>/shard_<year>_<first>.npy sample results of a shard (samples x components)
+    <path>/shard_<year>_<first>.pkl or its `StreamStats` accumulator
+
+A shard's file is complete (written under a temporary name, then renamed) before its
+line is appended to the log. On opening, a last line cut short by an interruption
+is truncated from the log (so the next line starts clean), and any line that is not
+two integers is skipped: that shard is simply run again.
+
+The random stream of every shard derives from the stream of its year, stored in
+the index: a resumed run redraws exactly the samples of the shards not yet done,
+so its results are identical to those of an uninterrupted run.
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+
+
+def seed_to_json(seedseq):
+    """JSON-ready state of a np.random.SeedSequence"""
+    return {"entropy": str(seedseq.entropy), "spawn_key": list(seedseq.spawn_key)}
+
+
+def seed_from_json(d):
+    return np.random.SeedSequence(int(d["entropy"]), spawn_key=tuple(d["spawn_key"]))
+
+
+class RunCheckpoint:
+    """Directory of the completed shards of one run, with a JSON index and a log
+
+    path -- checkpoint directory (created if missing)\n
+    settings -- dict (JSON-compatible) of the run settings; resuming from a
+            checkpoint of a run with other settings raises ValueError\n
+    year_seeds -- dict of the SeedSequence of each year, used for a new checkpoint
+            (those of an existing checkpoint are kept, see `year_seeds`)
+    """
+
+    def __init__(self, path, settings, year_seeds):
+        self.path = path
+        index_file = os.path.join(path, "index.json")
+        settings = json.loads(json.dumps(settings))  # as it reads back
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                self.index = json.load(f)
+            if self.index["settings"] != settings:
+                raise ValueError(
+                    "checkpoint %s is of a run with other settings: %s"
+                    % (path, self.index["settings"])
+                )
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.index = {
+                "settings": settings,
+                "year_seeds": {str(y): seed_to_json(s) for y, s in year_seeds.items()},
+            }
+            self._write_index()
+        self._done = set()
+        self._log_file = os.path.join(path, "shards.log")
+        if os.path.exists(self._log_file):
+            with open(self._log_file, "rb+") as f:
+                log = f.read()
+                complete = log.rfind(b"\n") + 1
+                if complete < len(log):  # cut short: drop it before appending
+                    f.truncate(complete)
+            for line in log[:complete].decode(errors="replace").splitlines():
+                fields = line.split()
+                if len(fields) == 2 and all(x.lstrip("-").isdigit() for x in fields):
+                    self._done.add((int(fields[0]), int(fields[1])))
+
+    # ---------------------------------------------------------------------
+    @property
+    def year_seeds(self):
+        """dict of the SeedSequence of each year of the run"""
+        return {int(y): seed_from_json(d) for y, d in self.index["year_seeds"].items()}
+
+    def _file(self, year, first, ext):
+        return os.path.join(self.path, "shard_%d_%d.%s" % (year, first, ext))
+
+    def _write_index(self):
+        tmp = os.path.join(self.path, "index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, "index.json"))
+
+    # ---------------------------------------------------------------------
+    def has_shard(self, year, first):
+        return (int(year), int(first)) in self._done
+
+    def save_shard(self, year, first, result):
+        """store the result (sample array or `StreamStats`) of the shard of `year`
+        starting at sample `first`, then mark it done in the log"""
+        year, first = int(year), int(first)
+        if isinstance(result, np.ndarray):
+            filename = self._file(year, first, "npy")
+            with open(filename + ".tmp", "wb") as f:
+                np.save(f, result)
+        else:
+            filename = self._file(year, first, "pkl")
+            with open(filename + ".tmp", "wb") as f:
+                pickle.dump(result, f)
+        os.replace(filename + ".tmp", filename)  # complete before it is logged
+        with open(self._log_file, "a") as f:
+            f.write("%d %d\n" % (year, first))
+            f.flush()
+            os.fsync(f.fileno())
+        self._done.add((year, first))
+
+    def load_shard(self, year, first):
+        """return the stored result of the shard of `year` starting at sample `first`"""
+        filename = self._file(int(year), int(first), "npy")
+        if os.path.exists(filename):
+            return np.load(filename)
+        with open(self._file(int(year), int(first), "pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def shards_done(self, year):
+        """return sorted first samples of the completed shards of `year`"""
+        return sorted(first for (y, first) in self._done if y == int(year))
+
+    def __len__(self):
+        """number of completed shards"""
+        return len(self._done)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+stream_stats.py
+One-pass, mergeable summary statistics for Monte Carlo results, computed
+block by block without keeping the full sample matrix.
+
+    Moments: parallel (Chan et al.) form of Welford's algorithm.
+    Quantiles: KLL compactor sketch, vectorized over columns.
+"""
+import numpy as np
+
+
+class StreamStats:
+    """Running mean, std, min, max and quantiles for each column of a stream of blocks
+
+    numvars -- number of columns (variables) tracked\n
+    k -- sketch accuracy parameter: quantile rank error is roughly 1/k,
+         memory is O(k * numvars) whatever the number of samples (default = 2000)\n
+    seed -- seed for the sketch compaction coin flips (default = 0)
+
+    Blocks are added with `update`, and accumulators (e.g. from pool workers)
+    combined with `merge`. Until more than about k samples have been added,
+    the quantiles are exact (same linear interpolation as `np.percentile`).
+    """
+
+    _c = 2.0 / 3.0  # KLL capacity decay from the top level down
+
+    def __init__(self, numvars, k=2000, seed=0):
+        self.numvars = numvars
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.mean = np.zeros(numvars)
+        self.m2 = np.zeros(numvars)  # sum of squared deviations from mean
+        self.min = np.full(numvars, np.inf)
+        self.max = np.full(numvars, -np.inf)
+        self.levels = [np.zeros([0, numvars])]  # items at level h have weight 2**h
+
+    # ---------------------------------------------------------------------
+    def update(self, block):
+        """add a block (num_samples x numvars array) of samples"""
+        block = np.asarray(block, dtype=float).reshape(-1, self.numvars)
+        n = len(block)
+        if n == 0:
+            return self
+        self._merge_moments(
+            n,
+            np.mean(block, axis=0),
+            np.sum((block - np.mean(block, axis=0)) ** 2, axis=0),
+            np.min(block, axis=0),
+            np.max(block, axis=0),
+        )
+        self.levels[0] = np.concatenate([self.levels[0], block])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """combine the samples of accumulator `other` into this one"""
+        if other.count == 0:
+            return self
+        self._merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros([0, self.numvars]))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self._compress()
+        return self
+
+    def _merge_moments(self, n, mean, m2, mn, mx):
+        tot = self.count + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n / tot)
+        self.m2 = self.m2 + m2 + delta**2 * (self.count * n / tot)
+        self.count = tot
+        self.min = np.minimum(self.min, mn)
+        self.max = np.maximum(self.max, mx)
+
+    # ---------------------------------------------------------------------
+    def _capacity(self, h):
+        depth = len(self.levels) - 1 - h
+        return max(2, int(np.ceil(self.k * self._c**depth)))
+
+    def _compress(self):
+        """compact any level over capacity: keep every other sorted item, at double weight"""
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.zeros([0, self.numvars]))
+                items = np.sort(items, axis=0)
+                keep = len(items) % 2  # odd item stays at this level
+                offset = self.rng.integers(2)
+                promoted = items[keep + offset :: 2]
+                self.levels[h] = items[:keep]
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                h = 0  # capacities shift when a level is added
+            else:
+                h += 1
+
+    # ---------------------------------------------------------------------
+    @property
+    def std(self):
+        """population standard deviation (as `np.std`)"""
+        return np.sqrt(self.m2 / self.count)
+
+    def percentile(self, p):
+        """estimated `p`th percentile (0 to 100) of each column"""
+        values = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(items), 2.0**h) for h, items in enumerate(self.levels)]
+        )
+        order = np.argsort(values, axis=0)
+        result = np.zeros(self.numvars)
+        for n in range(self.numvars):
+            v = values[order[:, n], n]
+            w = weights[order[:, n]]
+            # rank position of each item (0 to count-1), at the middle of its weight
+            pos = np.cumsum(w) - (w + 1.0) / 2.0
+            result[n] = np.interp(p / 100.0 * (self.count - 1), pos, v)
+        return result
+
+    def stats(self):
+        """return numpy array (6 x numvars) of Mean, Stddev, Min, 5th and 95th percentile, Max"""
+        return np.array(
+            [
+                self.mean,
+                self.std,
+                self.min,
+                self.percentile(5.0),
+                self.percentile(95.0),
+                self.max,
+            ]
+        )
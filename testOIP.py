@@ -26,8 +26,16 @@ import os
 
 # %%
 # general libraries
+import concurrent.futures  # process pool for shards of samples
+import contextlib
+import hashlib
+import itertools
+import json
 import numpy as np
+import os
 import pprint
+import tempfile
+import time
 
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -39,6 +47,10 @@ import OIP  # for alt_parameter_cases, disrSizes, disrProbs, eval_one_case
 import rand_dists_added as rda  # random number generation
 import sheet_utils as su  # specify ranges, read workbooks, sheets and ranges
 import utilities  # for column_from2DList
+from results_store import ResultsStore  # per-year memory-mapped results
+from run_checkpoint import RunCheckpoint  # completed shards of a run, for resuming
+from stream_stats import StreamStats  # one-pass, mergeable result statistics
+import workbook_cache  # parsed-workbook snapshots, keyed by path, mtime and hash
 
 # %%
 old_model_workbook_filename = "Oil_Import_Premium_2005_risk_v21main_2011Dev_v14.xls"
@@ -52,9 +64,15 @@ model_sheet_name = "OilImportPremium2017"
 
 # read entire workbook to dict of dataframes, one for each sheet
 #  (The dataframes may be pretty ill-formed, if the sheet is.)
-readnew_workbook = True
+#  Not when imported by `simulate_OIP` pool worker processes.
+#  Parsed once, then loaded from the workbook cache until the workbook changes.
+readnew_workbook = __name__ == "__main__"
 if readnew_workbook:
-    wb = pd.read_excel(model_workbook_filename, sheet_name=None, header=None)
+    wb = workbook_cache.cached_read(
+        model_workbook_filename,
+        "sheets",
+        lambda path: pd.read_excel(path, sheet_name=None, header=None),
+    )
     ws = wb[model_sheet_name]  # select desired sheet
 
 # %%
@@ -82,40 +100,73 @@ if readnew_workbook:
 
 # %%
 # def fn to generate random sample for random variables
-def gen_test_means(rvDict, samplesz=10, debug=False):
+def _dist_args(pp, xv):
+    """return arguments (after the sample count) of the distribution function for one r.v.
+
+    pp -- param prob info list, as an entry of `OIP.parameter_probabilities`\n
+    xv -- low, mid, high values of the param\n
+    return tuple of args, or None if the distribution type is not handled
+    """
+    if pp[0] == "risk_discrete":
+        return (xv, pp[1])
+    elif pp[0] == "risk_triangular" or pp[0] == "risk_rtriangular":
+        return tuple(xv)  # ??? *xv?
+    elif pp[0] == "risk_cumul":
+        return (pp[1][0], pp[1][1], pp[1][2], sorted(xv))
+    return None
+
+
+def gen_test_means(
+    rvDict,
+    samplesz=10,
+    debug=False,
+    param_cases=None,
+    rng=None,
+    method="mc",
+    antithetic=False,
+):
     """generate random sample for random variables in dictionary 'OIP.parameter_probabilities'
 
     rvDict -- dictionary of random variables, each entry giving name and list\n
     samplesz -- number of samples for each r.v. (default = 10)\n
     debug -- boolean if debug printouts wanted (default = False)\n
+    param_cases -- dict of dist parameters (default = global `OIP.alt_parameter_cases`)\n
+    rng -- numpy.random.Generator to draw from (default = global numpy.random state)\n
+    method -- "mc" (pseudo-random), "lhs" (Latin Hypercube) or "sobol" (scrambled Sobol)
+              uniforms, one column per random variable (default = "mc")\n
+    antithetic -- if True, samples come in antithetic pairs (rows 2i, 2i+1 from
+              uniforms u and 1-u), drawn through the inverse CDFs (default = False)\n
     return dictionary with samples for each random variable.
 
-    Relies on dist parameters in global `OIP.alt_parameter_cases`
-    Relies on dict of distrib functions in `rda.risk_function_dict`
+    Relies on dist parameters in global `OIP.alt_parameter_cases`, unless `param_cases` given
+    Relies on dict of distrib functions in `rda.risk_function_dict`, or for "lhs",
+    "sobol" and antithetic samples the inverse CDFs in `rda.inverse_cdf_dict`
     """
     # get keys to random parameters
     kl = rvDict.keys()
 
     # for k in kl:    # pick up probabilities and append alternative values (dropping right columns with mean and a given sample)
     #     OIP.parameter_probabilities[k].append(OIP.alt_parameter_cases[k][:-2])
+    if param_cases is None:
+        param_cases = OIP.alt_parameter_cases
+    urvs = None
+    if method != "mc" or antithetic:
+        urvs = rda.uniform_design(samplesz, len(kl), method, rng, antithetic)
     samples = {}
-    for k in kl:
+    for n, k in enumerate(kl):
         # pick up probabilities and append alternative values (dropping right columns with mean and a given sample)
         pp = rvDict[k]  # param prob info list
-        xv = OIP.alt_parameter_cases[k][:-2]  # low, mid, high values
+        xv = param_cases[k][:-2]  # low, mid, high values
         dist_fn = rda.risk_function_dict[pp[0]]  # prob dist fn to call
-
-        if pp[0] == "risk_discrete":
-            samples[k] = dist_fn(xv, pp[1], count=samplesz)
-        elif pp[0] == "risk_triangular" or pp[0] == "risk_rtriangular":
-            samples[k] = dist_fn(*xv, count=samplesz)  # ??? *xv?
-        elif pp[0] == "risk_cumul":
-            xv.sort()
-            samples[k] = dist_fn(pp[1][0], pp[1][1], pp[1][2], xv, count=samplesz)
-        else:
-            samples[k] = np.zeros(samplesz) * np.NaN
+        dist_args = _dist_args(pp, xv)
+        if dist_args is None:
+            samples[k] = np.full(samplesz, np.nan)
+        elif urvs is None:
+            samples[k] = dist_fn(*dist_args, count=samplesz, rng=rng)
+        else:  # stratified/low-discrepancy uniforms through the inverse CDF
+            samples[k] = rda.inverse_cdf_dict[pp[0]](urvs[:, n], *dist_args)
         if debug:  # compare sample mean to recorded mean
-            expected_mean = OIP.alt_parameter_cases[k][3]
+            expected_mean = param_cases[k][3]
             if expected_mean == 0.0:
                 if samples[k].mean() == 0.0:
                     mratio = 1.0
@@ -133,6 +184,22 @@ def gen_test_means(rvDict, samplesz=10, debug=False):
     return samples
 
 
+def param_means(rvDict, param_cases=None):
+    """return dictionary of the exact mean of each random variable sampled by `gen_test_means`
+
+    rvDict -- dictionary of random variables, each entry giving name and list\n
+    param_cases -- dict of dist parameters (default = global `OIP.alt_parameter_cases`)
+    """
+    if param_cases is None:
+        param_cases = OIP.alt_parameter_cases
+    means = {}
+    for k, pp in rvDict.items():
+        dist_args = _dist_args(pp, param_cases[k][:-2])
+        means[k] = np.nan if dist_args is None else rda.mean_dict[pp[0]](*dist_args)
+    means["Elas:Other NonOPEC Demand"] = -means["Elas:Other NonOPEC Supply"]
+    return means
+
+
 # %%
 # def fn to open a workbook, given its name, and return the open workbook object
 def linkto_workbook(wb_name):
@@ -144,6 +211,25 @@ def linkto_workbook(wb_name):
     return book
 
 
+# %%
+def cached_workbook_read(name, reader, wb_name=None):
+    """parse the model workbook with `reader`, or load the parse from the workbook cache
+
+    name -- name of the cached parse (e.g. "market_data")\n
+    reader -- function of an open workbook, e.g. `read_OIP_market_data`\n
+    wb_name -- workbook filename (default = `model_workbook_filename`)\n
+    returns `reader(book)`, reparsed only if the workbook has changed
+    """
+    if wb_name is None:
+        wb_name = model_workbook_filename
+    return workbook_cache.cached_read(
+        wb_name,
+        name,
+        lambda path: reader(linkto_workbook(path)),
+        reader_args={"sheet": model_sheet_name},
+    )
+
+
 # %%
 def read_OIPRandomFix(book):
     """read model excel sheet for some key params and switches
@@ -231,27 +317,33 @@ def read_OIP_market_data(book):
 
 # %%
 def set_market_data_for_year(md, year=2015):
-    """select market data for a particular year
+    """select market data for a particular year, for the scalar `OIP.eval_one_case` path
 
-    md -- dict of market data series by year\n
+    md -- dict of market data series by year, or `OIP.MarketTable`\n
     return curr_mkt_parameter_cases, update global `oilmkt_parameter_cases`
+    (batched code uses `OIP.MarketTable` blocks instead, leaving globals unchanged)
     """
-    for n in range(len(md["Year"])):
-        if int(round(md["Year"][n])) == year:
-            break
-    # print("Year %4d is element %3d in md." % (year,n))
+    mkt_year = market_snapshot_for_year(md, year).to_dict()
     curr_mkt_parameter_cases = {}
     for k in OIP.oilmkt_parameter_cases:
-        if k not in md:
-            print("Missing market data for: ", k)
-        else:  # update based on matching key
-            curr_mkt_parameter_cases[k] = md[k][n]
-            OIP.oilmkt_parameter_cases[k][1] = md[k][
-                n
-            ]  # WARNING: sets only the Midcase values for AEO
+        curr_mkt_parameter_cases[k] = mkt_year[k][1]
+        # WARNING: sets only the Midcase values for AEO
+        OIP.oilmkt_parameter_cases[k][1] = mkt_year[k][1]
     return curr_mkt_parameter_cases
 
 
+def market_snapshot_for_year(md, year=2015):
+    """return an immutable `OIP.MarketBlock` of market data by AEO case for a particular year
+
+    md -- dict of market data series by year, or `OIP.MarketTable` built from one\n
+    Year data are in the Mid case column, other cases from `OIP.oilmkt_parameter_cases`
+    (see `OIP.MarketTable.from_market_data`). Globals are left unchanged.
+    """
+    if not isinstance(md, OIP.MarketTable):
+        md = OIP.MarketTable.from_market_data(md)
+    return md.block(year)
+
+
 # %%
 # names of premium components to be calculated over sample
 pi_component_names = [
@@ -283,16 +375,235 @@ pi_stat_names = [
 ]
 
 # %%
-def simulate_OIP(num_samples=1):
+# samples per shard: each shard of a simulation draws from its own random stream,
+# so results depend on the seed and shard size, not on the number of workers
+default_shard_size = 50000
+
+
+def method_size(size, method):
+    """return `size`, or for method "sobol" the largest power of 2 up to it, so that a
+    default-sized Sobol design keeps its balance properties"""
+    if method == "sobol":
+        return 1 << (int(size).bit_length() - 1)
+    return size
+
+
+def shard_seeds(seed, num_shards):
+    """return `num_shards` independent SeedSequences spawned from root `seed`
+
+    seed -- int or np.random.SeedSequence\n
+    Shard n always gets the same child stream, however many shards are drawn.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [
+        np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (n,))
+        for n in range(num_shards)
+    ]
+
+
+def _simulate_shard(shard):
+    """simulate one shard of samples with its own random stream (pool worker)
+
+    shard -- dict of shard spec, as built by `_shard_tasks`\n
+    return numpy array of dim count x 14 of premium components, or their
+    `StreamStats` accumulator if shard["keep_samples"] is False
+    """
+    param_cases = shard["param_cases"]
+    switches = shard["switches"]
+    rng = np.random.default_rng(shard["seedseq"])  # this shard's random stream
+    sam = gen_test_means(
+        shard["rvDict"],
+        samplesz=shard["count"],
+        param_cases=param_cases,
+        rng=rng,
+        method=shard["method"],
+        antithetic=shard["antithetic"],
+    )  # random values for random parameters
+    # one contiguous block of sampled values (fields not sampled from RandomFix case)
+    params = OIP.ParamBlock.from_dict(sam, fill=param_cases)
+    # Note: disrSizes, disrProbs (unless drawn by case) and switches fixed for each simulation
+    if shard["opt"]:  # Opt case: optimal tariff solved for each sample
+        results, opt = OIP.solve_opt_cases(
+            params,
+            shard["disrSizes"],
+            shard["disrProbs"],
+            switches,
+            mkt_cases=shard["mkt_cases"],
+        )
+        unconverged = np.flatnonzero(~opt["converged"])
+        if len(unconverged) > 0:
+            print("Opt case not converged for samples ", shard["first"] + unconverged)
+    else:
+        results = OIP.eval_cases_batch(
+            params,
+            shard["disrSizes"],
+            shard["disrProbs"],
+            switches,
+            mkt_cases=shard["mkt_cases"],
+        )
+    invalid = np.flatnonzero(np.isnan(results[:, 0]))
+    if len(invalid) > 0:
+        print("Invalid result 0 (pi_tot) for samples ", shard["first"] + invalid)
+        pprint.pprint(switches)
+        for k, v in params.to_dict().items():
+            print("%30s  %8.5f" % (str(k)[:30], v[invalid[0]]))
+    if shard["control"] is not None:  # append linear proxy of each component
+        x0, pi0, grad = shard["control"]
+        results = np.hstack([results, pi0 + (params.values - x0).T @ grad])
+    if not shard["keep_samples"]:
+        return StreamStats(results.shape[1]).update(results)
+    return results
+
+
+def _shard_tasks(
+    num_samples,
+    seed,
+    shard_size,
+    mkt_cases,
+    keep_samples=True,
+    method="mc",
+    antithetic=False,
+    control=None,
+    opt=False,
+    prob_case_draws=False,
+    year=None,
+):
+    """return list of `_simulate_shard` specs for one simulation of `num_samples`
+
+    Each shard is an independent design of `method` ("mc", "lhs" or "sobol"),
+    randomized by its own stream. `control`, if given, is (x0, pi0, grad) of a
+    linearization (see `premium_gradient`), whose value for each sample is appended
+    to its premium components. If `opt`, the shards evaluate the Opt case. If
+    `prob_case_draws`, their disrProbs is None (a row of `OIP.disr_prob_table` by sample).
+    `year`, if given, labels the shards of a multi-year run (see `RunCheckpoint`).
+    If `antithetic`, an odd shard_size is rounded up to even, so that each shard's
+    antithetic pairs are rows 2i and 2i+1 of the whole run.
+
+    requires globals `OIP.parameter_probabilities`, `OIP.alt_parameter_cases`,
+                `OIP.disrSizes`, `OIP.disrProbs`, `OIP_default_switches`
+    """
+    if antithetic:
+        shard_size += shard_size % 2  # pairs don't straddle shards
+    firsts = range(0, num_samples, shard_size)
+    return [
+        {
+            "seedseq": seedseq,
+            "first": first,
+            "count": min(shard_size, num_samples - first),
+            "rvDict": OIP.parameter_probabilities,
+            "param_cases": OIP.alt_parameter_cases,
+            "mkt_cases": mkt_cases,
+            "disrSizes": OIP.disrSizes,
+            "disrProbs": None if prob_case_draws else OIP.disrProbs,
+            "switches": OIP.OIP_default_switches,
+            "keep_samples": keep_samples,
+            "method": method,
+            "antithetic": antithetic,
+            "control": control,
+            "opt": opt,
+            "year": year,
+        }
+        for seedseq, first in zip(shard_seeds(seed, len(firsts)), firsts)
+    ]
+
+
+def _map_shards(mapper, shards, checkpoint=None):
+    """evaluate `_simulate_shard` over list of shards with `mapper` (map, or a pool's map)
+
+    checkpoint -- optional `RunCheckpoint`: shards it holds are loaded instead of
+                evaluated, and the others saved to it as they are yielded\n
+    yields shard results, in order of `shards`
+    """
+    if checkpoint is None:
+        yield from mapper(_simulate_shard, shards)
+        return
+    todo = [sh for sh in shards if not checkpoint.has_shard(sh["year"], sh["first"])]
+    todo_ids = {id(sh) for sh in todo}
+    todo_results = mapper(_simulate_shard, todo)
+    for sh in shards:
+        if id(sh) in todo_ids:
+            r = next(todo_results)
+            checkpoint.save_shard(sh["year"], sh["first"], r)
+        else:
+            r = checkpoint.load_shard(sh["year"], sh["first"])
+        yield r
+
+
+def _run_shards(shards, workers=1, checkpoint=None):
+    """evaluate list of shards, on a pool of `workers` processes if workers > 1
+
+    Shards are queued individually, so a pool stays busy until the last shard.
+    checkpoint -- optional `RunCheckpoint` of completed shards (see `_map_shards`)
+    yields shard results, in order of `shards`
+    """
+    if workers > 1 and len(shards) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from _map_shards(pool.map, shards, checkpoint)
+    else:
+        yield from _map_shards(map, shards, checkpoint)
+
+
+def _gather_shards(shard_results, num_tracked_vars):
+    """combine shard results (in shard order) into one sample matrix or `StreamStats`
+
+    Accumulators are merged as they arrive, so only one is held at a time.
+    """
+    gathered = None
+    samples = []
+    for r in shard_results:
+        if isinstance(r, StreamStats):
+            gathered = r if gathered is None else gathered.merge(r)
+        else:
+            samples.append(r)
+    if gathered is None:
+        gathered = np.vstack(samples)[
+            :, :num_tracked_vars
+        ]  # gather all returned values, truncating if necessary
+    return gathered
+
+
+def simulate_OIP(
+    num_samples=1,
+    workers=1,
+    seed=None,
+    shard_size=None,
+    mkt_cases=None,
+    keep_samples=True,
+    method="mc",
+    antithetic=False,
+    opt=False,
+    prob_case_draws=False,
+):
     """simulate OIP calculation num_samples times for one year and param distributions
 
     num_samples -- rand sample size for params. =-1 for solution with default/test param values\n
-    return `sample_results` a numpy array of dim num_samples x num_tracked_vars\n
-
-    requires and alters globals `OIP.alt_parameter_cases`, `OIP.disrSizes`,
+    workers -- number of worker processes sharing the shards of samples (default = 1, in-process)\n
+    seed -- root seed (int or np.random.SeedSequence) for the shard random streams
+                (default = next stream spawned from `OIP.root_seed`)\n
+    shard_size -- samples per shard (default = `default_shard_size`, rounded down to a
+                power of 2 for method "sobol", see `method_size`)\n
+    mkt_cases -- `OIP.MarketBlock` of market data by AEO case
+                (default = from global `OIP.oilmkt_parameter_cases`)\n
+    keep_samples -- if False, keep only a streaming `StreamStats` accumulator of the
+                results (memory independent of num_samples) (default = True)\n
+    method -- sampling of the uncertain params in `gen_test_means`: "mc", "lhs" or "sobol"
+                (default = "mc"); for "sobol", shard sizes are best powers of 2\n
+    antithetic -- if True, draw samples in antithetic pairs, rows 2i and 2i+1 (an odd
+                shard_size is rounded up to even for this) (default = False)\n
+    opt -- if True, evaluate the Opt (optimal tariff) case, solved for each sample by
+                `OIP.solve_opt_cases`, instead of the Ref case (default = False)\n
+    prob_case_draws -- if True, each sample's disruption probabilities are the row of
+                `OIP.disr_prob_table` picked by its draw of "Disruption Prob Case Selector",
+                instead of `OIP.disrProbs` (its AEO case is always its own draw) (default = False)\n
+    return `sample_results` a numpy array of dim num_samples x num_tracked_vars,
+    or its `StreamStats` accumulator if keep_samples is False\n
+
+    Each shard of samples is evaluated in one call to `OIP.eval_cases_batch`. For a
+    given seed and shard_size the results are identical for any number of workers.
+    requires globals `OIP.alt_parameter_cases`, `OIP.oilmkt_parameter_cases`, `OIP.disrSizes`,
                 `OIP.disrProbs`, `OIP_default_switches`, `pi_component_names`
     """
-    global alt_parameter_cases, disrSizes, dirsProbs, OIP_default_switches
     global pi_component_names
     num_tracked_vars = len(pi_component_names)
     switches = OIP.OIP_default_switches
@@ -307,43 +618,27 @@ def simulate_OIP(num_samples=1):
             )
         )
     else:
-        sam = gen_test_means(
-            rvDict=OIP.parameter_probabilities, samplesz=num_samples
-        )  # random values for random parameters
-        random_fix_index = 4
-        sample_results = np.ones([num_samples, num_tracked_vars])
-        for n in range(num_samples):
-            for k in sam:  # loop over parameters in dictionary of sampled parameters
-                if k in OIP.alt_parameter_cases:
-                    OIP.alt_parameter_cases[k][random_fix_index] = sam[k][n]
-                else:
-                    print("Skipping: ", k)
-            # switches[2] = 1.0+np.random.normal(0.0,0.25) # Switch_DomDem_ElasMult
-            # Note: disrSizes, disrProbs and switches are fixed for each MC simulation
-            sample_results[n] = np.array(
-                OIP.eval_one_case(
-                    OIP.alt_parameter_cases, OIP.disrSizes, OIP.disrProbs, switches
-                )[:num_tracked_vars]
-            )  # gather all returned values, truncating if necessary
-            if np.isnan(sample_results[n][0]):
-                print("Invalid result 0 (pi_tot) for sample ", n)
-                print(
-                    OIP.eval_one_case(
-                        OIP.alt_parameter_cases, OIP.disrSizes, OIP.disrProbs, switches
-                    )
-                )
-                pprint.pprint(switches)
-                for k in OIP.alt_parameter_cases:
-                    if not k == "KEY_PARAMETERS_ASSUMPTIONS":
-                        print(
-                            "%30s  %8.5f"
-                            % (
-                                str(k)[:30],
-                                OIP.alt_parameter_cases[k][random_fix_index],
-                            )
-                        )
-            if n % 1000 == 0:
-                print("  iteration ", n)
+        for k in OIP.parameter_probabilities:
+            if k not in OIP.alt_parameter_cases:
+                print("Skipping: ", k)
+        if seed is None:
+            seed = OIP.root_seed.spawn(1)[0]
+        if shard_size is None:
+            shard_size = method_size(default_shard_size, method)
+        if mkt_cases is None:
+            mkt_cases = OIP.MarketBlock.from_dict(OIP.oilmkt_parameter_cases)
+        shards = _shard_tasks(
+            num_samples,
+            seed,
+            shard_size,
+            mkt_cases,
+            keep_samples,
+            method,
+            antithetic,
+            opt=opt,
+            prob_case_draws=prob_case_draws,
+        )
+        sample_results = _gather_shards(_run_shards(shards, workers), num_tracked_vars)
     return sample_results
 
 
@@ -351,10 +646,17 @@ def simulate_OIP(num_samples=1):
 def result_stats(results, component_names, debug=False):
     """return a numpy array of statistics for each variable in component names
 
-    results -- array of random outcomes for each variable in component_names
+    results -- array of random outcomes for each variable in component_names,
+                or their `StreamStats` accumulator (see `simulate_OIP(keep_samples=False)`)
     component_names -- list of random variate names
     debug -- boolean indicating if debugging info to be printed (default = False)
     """
+    if isinstance(results, StreamStats):  # one-pass statistics, already accumulated
+        ystats = results.stats()[:, : len(component_names)]
+        if debug:
+            for name, row in zip(pi_stat_names, ystats):
+                print("%-17s" % (name + ":"), row)
+        return ystats
     numstats = 6  # number of statistics tracked
     numvars = len(component_names)
     ystats = np.zeros([numstats, numvars])
@@ -386,25 +688,899 @@ def result_stats(results, component_names, debug=False):
 
 
 # %%
-def sim_OIP_over_years(num_samples=1, yearlist=[]):
+# confidence level of the intervals used for precision-targeted runs
+ci_confidence = 0.95
+# samples per shard (and per stopping check) in precision-targeted runs
+default_chunk_size = 10000
+
+
+def precision_half_widths(results, components=["pi_tot"], confidence=None):
+    """return half-widths of confidence intervals on the mean and 95th percentile
+
+    results -- sample matrix, or its `StreamStats` accumulator
+    components -- names (in `pi_component_names`) of the components wanted
+    confidence -- confidence level of the intervals (default = `ci_confidence`)
+    return (mean_half_width, p95_half_width), arrays with an element per component
+
+    The mean interval is the normal one, z * stddev / sqrt(n). The percentile interval
+    runs between the order statistics of rank n * (p -/+ z * sqrt(p * (1-p) / n)).
+    """
+    if confidence is None:
+        confidence = ci_confidence
+    ndx = [pi_component_names.index(c) for c in components]
+    z = stats.norm.ppf(0.5 + confidence / 2.0)
+    p = 0.95
+    if isinstance(results, StreamStats):
+        n = results.count
+        std = results.std[ndx]
+        pctl = lambda q: results.percentile(q)[ndx]
+    else:
+        n = len(results)
+        std = np.std(results[:, ndx], axis=0)
+        pctl = lambda q: np.percentile(results[:, ndx], q, axis=0)
+    d = z * np.sqrt(p * (1.0 - p) / n)
+    mean_hw = z * std / np.sqrt(n)
+    p95_hw = (pctl(100.0 * min(p + d, 1.0)) - pctl(100.0 * max(p - d, 0.0))) / 2.0
+    return mean_hw, p95_hw
+
+
+def _run_to_precision(
+    year_shards,
+    workers,
+    target,
+    target_p95=None,
+    components=["pi_tot"],
+    checkpoint=None,
+):
+    """evaluate the shards of each year, in order, until its target precision is met
+
+    year_shards -- dict of list of shards for each year (all of its sample budget)
+    target -- target half-width of the confidence interval on the mean of `components`
+    target_p95 -- optional target half-width for their 95th percentile
+    checkpoint -- optional `RunCheckpoint` of completed shards (see `_map_shards`)
+    return dict of gathered results (sample matrix or `StreamStats`) for each year
+
+    Each round queues the next shards of the years not yet converged, spread to keep
+    `workers` busy. A year's result is the prefix of its shards up to the first at
+    which the target is met, so it does not depend on the number of workers.
+    """
+    num_tracked_vars = len(pi_component_names)
+    acc = {y: StreamStats(num_tracked_vars) for y in year_shards}
+    samples = {y: [] for y in year_shards}
+    queued = {y: 0 for y in year_shards}
+    done = set()
+
+    def met(y):
+        mean_hw, p95_hw = precision_half_widths(acc[y], components)
+        return np.all(mean_hw <= target) and (
+            target_p95 is None or np.all(p95_hw <= target_p95)
+        )
+
+    with contextlib.ExitStack() as stack:
+        mapper = map
+        if workers > 1:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            mapper = stack.enter_context(pool).map
+        while True:
+            active = [
+                y
+                for y in year_shards
+                if y not in done and queued[y] < len(year_shards[y])
+            ]
+            if not active:
+                break
+            per_year = -(-workers // len(active))  # ceil: fill the pool
+            batch = []
+            for y in active:
+                count = min(per_year, len(year_shards[y]) - queued[y])
+                batch += [(y, sh) for sh in year_shards[y][queued[y] :][:count]]
+                queued[y] += count
+            batch_results = _map_shards(mapper, [sh for (y, sh) in batch], checkpoint)
+            for (y, sh), r in zip(batch, batch_results):
+                if y in done:
+                    continue  # shards queued past convergence are dropped
+                if isinstance(r, StreamStats):
+                    acc[y].merge(r)
+                else:
+                    acc[y].update(r)
+                    samples[y].append(r)
+                if met(y):
+                    done.add(y)
+    return {y: np.vstack(samples[y]) if samples[y] else acc[y] for y in year_shards}
+
+
+def precision_report(yrly_rslts, components=["pi_tot"], target=None, target_p95=None):
+    """print, and return as a dataframe, the precision achieved for each year
+
+    yrly_rslts -- dictionary of simulation results (samples or `StreamStats`) by year
+    components -- names of the components reported
+    target, target_p95 -- optional targets, to report whether each year met them
+    """
+    rows = []
+    for year, results in yrly_rslts.items():
+        mean_hw, p95_hw = precision_half_widths(results, components)
+        n = results.count if isinstance(results, StreamStats) else len(results)
+        for c, mhw, phw in zip(components, mean_hw, p95_hw):
+            rows.append([year, c, n, mhw, phw])
+    report = pd.DataFrame(
+        rows,
+        columns=[
+            "year",
+            "component",
+            "num_samples",
+            "mean_half_width",
+            "p95_half_width",
+        ],
+    )
+    if target is not None:
+        report["met"] = report.mean_half_width <= target
+        if target_p95 is not None:
+            report["met"] &= report.p95_half_width <= target_p95
+    print(report.to_string(index=False))
+    return report
+
+
+# %%
+def premium_gradient(x0, mkt_cases=None):
+    """return premium components and their gradient at one set of param values
+
+    x0 -- `OIP.ParamBlock` of one case (e.g. the "Mean" case)
+    mkt_cases -- `OIP.MarketBlock` of market data by AEO case
+                (default = from global `OIP.oilmkt_parameter_cases`)
+    return (pi0, grad): pi0 the 14 premium components at x0, and grad (params x 14)
+    their derivatives by param (see `OIP.premium_jacobian`)
+    """
+    pi, jac = OIP.premium_jacobian(
+        x0,
+        OIP.disrSizes,
+        OIP.disrProbs,
+        OIP.OIP_default_switches,
+        mkt_cases=mkt_cases,
+    )
+    return pi[0], jac[0]
+
+
+def check_premium_jacobian(num_samples=200, rel_step=1e-6, seed=None, mkt_cases=None):
+    """compare `OIP.premium_jacobian` with central differences at sampled param values
+
+    num_samples -- number of sampled sets of param values (default = 200)\n
+    rel_step -- central difference step, relative to max(|x|, 1) (default = 1e-6)\n
+    seed -- seed of the param samples (default = next stream spawned from `OIP.root_seed`)\n
+    mkt_cases -- as for `simulate_OIP`\n
+    return dataframe of the max absolute difference, by param, relative to the
+    largest derivative of any component by that param; its attrs["seconds"] gives
+    the times of one `OIP.eval_cases_batch` of the samples, of the Jacobian, and of
+    the central differences (2 evaluations per param)
+    """
+    if seed is None:
+        seed = OIP.root_seed.spawn(1)[0]
+    sam = gen_test_means(
+        OIP.parameter_probabilities,
+        samplesz=num_samples,
+        param_cases=OIP.alt_parameter_cases,
+        rng=np.random.default_rng(seed),
+    )
+    params = OIP.ParamBlock.from_dict(sam, fill=OIP.alt_parameter_cases)
+    args = (OIP.disrSizes, OIP.disrProbs, OIP.OIP_default_switches)
+    start = time.perf_counter()
+    OIP.eval_cases_batch(params, *args, mkt_cases=mkt_cases)
+    seconds = {"eval": time.perf_counter() - start}
+    start = time.perf_counter()
+    pi, jac = OIP.premium_jacobian(params, *args, mkt_cases=mkt_cases)
+    seconds["jacobian"] = time.perf_counter() - start
+    seconds["central_differences"] = 0.0
+    rows = []
+    for p, (sym, key) in enumerate(OIP.param_fields):
+        h = rel_step * np.maximum(np.abs(params.values[p]), 1.0)
+        up = params.values.copy()
+        up[p] += h
+        down = params.values.copy()
+        down[p] -= h
+        start = time.perf_counter()
+        fd = (
+            OIP.eval_cases_batch(OIP.ParamBlock(up), *args, mkt_cases=mkt_cases)
+            - OIP.eval_cases_batch(OIP.ParamBlock(down), *args, mkt_cases=mkt_cases)
+        ) / (2.0 * h[:, np.newaxis])
+        seconds["central_differences"] += time.perf_counter() - start
+        scale = np.nanmax(np.abs(jac[:, p]))
+        rows.append(
+            {
+                "param": sym,
+                "max_abs_deriv": scale,
+                "rel_error": np.nanmax(np.abs(fd - jac[:, p])) / max(scale, 1e-12),
+            }
+        )
+    result = pd.DataFrame(rows)
+    result.attrs["seconds"] = seconds
+    return result
+
+
+def check_eval_batch(num_samples=50, seed=None, num_bins=200):
+    """compare `OIP.eval_cases_batch` (the equations of `oip_graph.model`) with the
+    scalar `OIP.eval_one_case`, and its chunked evaluation along disruption sizes
+    with the unchunked one, at sampled param values
+
+    num_samples -- number of sampled sets of param values (default = 50)\n
+    seed -- seed of the param samples (default = next stream spawned from `OIP.root_seed`)\n
+    num_bins -- disruption sizes of the chunked comparison (default = 200)\n
+    return dataframe of the max absolute difference by premium component, of the
+    batch from the scalar results, and of the chunked from the unchunked results
+    """
+    if seed is None:
+        seed = OIP.root_seed.spawn(1)[0]
+    sam = gen_test_means(
+        OIP.parameter_probabilities,
+        samplesz=num_samples,
+        param_cases=OIP.alt_parameter_cases,
+        rng=np.random.default_rng(seed),
+    )
+    params = OIP.ParamBlock.from_dict(sam, fill=OIP.alt_parameter_cases)
+    switches = OIP.OIP_default_switches
+    batch = OIP.eval_cases_batch(params, OIP.disrSizes, OIP.disrProbs, switches)
+    one_case = np.empty_like(batch)
+    cases = {k: list(v) for k, v in OIP.alt_parameter_cases.items()}
+    for n in range(num_samples):
+        for (sym, key), x in zip(OIP.param_fields, params.values[:, n]):
+            cases[key][4] = x  # the RandomFix case of `eval_one_case`
+        one_case[n] = OIP.eval_one_case(cases, OIP.disrSizes, OIP.disrProbs, switches)
+
+    # many disruption sizes, in chunks of one size
+    sizes, probs = OIP.disruption_size_bins(
+        [0.0, 2.0, 5.0, 10.0, 20.0], [0.0, 0.3, 0.6, 0.9, 1.0], 0.3, num_bins
+    )
+    whole = OIP.eval_cases_batch(params, sizes, probs, switches)
+    chunk_cells = OIP.disr_chunk_cells
+    OIP.disr_chunk_cells = num_samples
+    try:
+        chunked = OIP.eval_cases_batch(params, sizes, probs, switches)
+    finally:
+        OIP.disr_chunk_cells = chunk_cells
+    return pd.DataFrame(
+        {
+            "batch_vs_one_case": np.nanmax(np.abs(batch - one_case), 0),
+            "chunked_vs_whole": np.nanmax(np.abs(chunked - whole), 0),
+        },
+        index=pi_component_names,
+    )
+
+
+def check_run_checkpoint():
+    """check that a `RunCheckpoint` whose log was cut short mid-line reopens, logs
+    further shards on lines of their own, and reopens again with all of them
+
+    return list of the (year, first) of the shards done on the last reopening
+    """
+    seeds = {2020: np.random.SeedSequence(1)}
+    with tempfile.TemporaryDirectory() as path:
+        checkpoint = RunCheckpoint(path, {"run": 1}, seeds)
+        checkpoint.save_shard(2020, 0, np.zeros((3, 2)))
+        with open(os.path.join(path, "shards.log"), "a") as f:
+            f.write("2020 12")  # interrupted while logging the shard at 12
+        checkpoint = RunCheckpoint(path, {"run": 1}, seeds)
+        assert checkpoint.shards_done(2020) == [0]
+        checkpoint.save_shard(2020, 5000, np.ones((3, 2)))
+        with open(os.path.join(path, "shards.log"), "a") as f:
+            f.write("not a shard\n2020\n")
+        checkpoint = RunCheckpoint(path, {"run": 1}, seeds)
+        assert checkpoint.shards_done(2020) == [0, 5000]
+        assert (checkpoint.load_shard(2020, 5000) == 1.0).all()
+        return [(2020, first) for first in checkpoint.shards_done(2020)]
+
+
+def estimate_OIP_means(
+    num_samples=10000,
+    components=["pi_tot", "pi_m", "pi_d"],
+    antithetic=True,
+    control_variate=True,
+    workers=1,
+    seed=None,
+    shard_size=None,
+    mkt_cases=None,
+    method="mc",
+):
+    """estimate mean premium components with antithetic pairs and/or a control variate
+
+    num_samples -- number of samples\n
+    components -- names of the components estimated (default = ["pi_tot", "pi_m", "pi_d"])\n
+    antithetic -- if True, sample in antithetic pairs, rows 2i and 2i+1 (see
+                `simulate_OIP`) (default = True)\n
+    control_variate -- if True, use as control the premium linearized around the
+                "Mean" case (column 3 of `OIP.alt_parameter_cases`), whose mean is
+                exact from the param distribution means (default = True)\n
+    workers, seed, shard_size, mkt_cases, method -- as for `simulate_OIP`\n
+    return (sample_results, report): the num_samples x 14 sample matrix, and a dataframe
+    of the plain and variance-reduced mean estimates, their standard errors and the
+    variance-reduction factor (plain over reduced variance of the estimate) per component
+    """
+    if seed is None:
+        seed = OIP.root_seed.spawn(1)[0]
+    if shard_size is None:
+        shard_size = method_size(default_shard_size, method)
+    if mkt_cases is None:
+        mkt_cases = OIP.MarketBlock.from_dict(OIP.oilmkt_parameter_cases)
+    num_tracked_vars = len(pi_component_names)
+    control = None
+    if control_variate:
+        mean_case = {
+            k: OIP.alt_parameter_cases[k][3] for k in OIP.parameter_probabilities
+        }
+        mean_case["Elas:Other NonOPEC Demand"] = -mean_case["Elas:Other NonOPEC Supply"]
+        x0 = OIP.ParamBlock.from_dict(mean_case, fill=OIP.alt_parameter_cases)
+        x_mean = OIP.ParamBlock.from_dict(
+            param_means(OIP.parameter_probabilities), fill=OIP.alt_parameter_cases
+        )
+        pi0, grad = premium_gradient(x0, mkt_cases)
+        control = (x0.values, pi0, grad)
+        proxy_mean = pi0 + (x_mean.values - x0.values)[:, 0] @ grad
+    shards = _shard_tasks(
+        num_samples, seed, shard_size, mkt_cases, True, method, antithetic, control
+    )
+    gathered = _gather_shards(_run_shards(shards, workers), 2 * num_tracked_vars)
+    results = gathered[:, :num_tracked_vars]
+
+    rows = []
+    for c in components:
+        n = pi_component_names.index(c)
+        y = results[:, n]
+        plain_se = np.std(y, ddof=1) / np.sqrt(len(y))
+        units = y
+        if antithetic:  # pair means are independent, samples are not
+            units = y[: len(y) // 2 * 2].reshape(-1, 2).mean(axis=1)
+        estimate = np.mean(units)
+        if control_variate:
+            z = gathered[:, num_tracked_vars + n]
+            if antithetic:
+                z = z[: len(z) // 2 * 2].reshape(-1, 2).mean(axis=1)
+            zvar = np.var(z, ddof=1)
+            beta = np.cov(units, z)[0, 1] / zvar if zvar > 0.0 else 0.0
+            estimate -= beta * (np.mean(z) - proxy_mean[n])
+            units = units - beta * z
+        se = np.std(units, ddof=1) / np.sqrt(len(units))
+        rows.append(
+            [c, len(y), np.mean(y), plain_se, estimate, se, (plain_se / se) ** 2]
+        )
+    report = pd.DataFrame(
+        rows,
+        columns=[
+            "component",
+            "num_samples",
+            "plain_mean",
+            "plain_std_err",
+            "estimate",
+            "std_err",
+            "vr_factor",
+        ],
+    )
+    print(report.to_string(index=False))
+    return results, report
+
+
+# %%
+def discrete_strata(rvDict, param_cases=None):
+    """return the joint support of the discrete ("risk_discrete") random variables
+
+    rvDict -- dictionary of random variables, as for `gen_test_means`\n
+    param_cases -- dict of dist parameters (default = global `OIP.alt_parameter_cases`)\n
+    return (keys, values, weights): the names of the discrete r.v.s, an array
+    (strata x r.v.s) of each joint combination of their values, and its probability.
+    Values with zero probability are dropped, and repeated values merged.
+    """
+    if param_cases is None:
+        param_cases = OIP.alt_parameter_cases
+    keys = [k for k, pp in rvDict.items() if pp[0] == "risk_discrete"]
+    supports = []
+    for k in keys:
+        xv, probs = _dist_args(rvDict[k], param_cases[k][:-2])
+        xv, probs = np.asarray(xv, dtype=float), np.asarray(probs, dtype=float)
+        vals, inv = np.unique(xv[probs > 0], return_inverse=True)
+        supports.append((vals, np.bincount(inv, probs[probs > 0]) / np.sum(probs)))
+    values = np.array(list(itertools.product(*[vals for vals, p in supports])))
+    weights = np.array(
+        [np.prod(w) for w in itertools.product(*[p for v, p in supports])]
+    )
+    return keys, values.reshape(len(weights), len(keys)), weights
+
+
+def simulate_OIP_stratified(
+    num_samples=10000, seed=None, mkt_cases=None, method="mc", shard_size=None
+):
+    """simulate OIP, enumerating the discrete params exactly and sampling the others
+
+    num_samples -- approximate total samples: each stratum (joint value of the
+                discrete params, see `discrete_strata`) gets samples of the continuous
+                params in proportion to its probability, at least 2 (default = 10000)\n
+    seed, mkt_cases -- as for `simulate_OIP`\n
+    method -- sampling of the continuous params, as for `simulate_OIP`: for "lhs" or
+                "sobol", each stratum gets its own design (default = "mc")\n
+    shard_size -- rows per `OIP.eval_cases_batch` call (default = `default_shard_size`)\n
+    return (sample_results, weights, strata): the sample matrix, stratum by stratum,
+    the probability weight of each row (the weights sum to 1), and its stratum index\n
+
+    The discrete dimensions add no sampling noise: statistics are weighted by stratum
+    probability (see `weighted_result_stats`, `stratified_std_err`).
+    """
+    if seed is None:
+        seed = OIP.root_seed.spawn(1)[0]
+    if shard_size is None:
+        shard_size = default_shard_size
+    if mkt_cases is None:
+        mkt_cases = OIP.MarketBlock.from_dict(OIP.oilmkt_parameter_cases)
+    keys, values, weights = discrete_strata(OIP.parameter_probabilities)
+    per_stratum = np.maximum(2, np.rint(weights * num_samples).astype(int))
+    strata = np.repeat(np.arange(len(weights)), per_stratum)
+    rng = np.random.default_rng(seed)
+    if method == "mc":
+        sam = gen_test_means(
+            OIP.parameter_probabilities,
+            samplesz=len(strata),
+            param_cases=OIP.alt_parameter_cases,
+            rng=rng,
+        )
+    else:  # a design of its own for each stratum, so each is stratified/balanced
+        dims = len(OIP.parameter_probabilities)
+        urvs = np.vstack(
+            [rda.uniform_design(n, dims, method, rng) for n in per_stratum]
+        )
+        sam = params_from_uniforms(OIP.parameter_probabilities, urvs)
+    for n, k in enumerate(keys):  # discrete params take each stratum's values
+        sam[k] = values[strata, n]
+    params = OIP.ParamBlock.from_dict(sam, fill=OIP.alt_parameter_cases)
+    sample_results = np.vstack(
+        [
+            OIP.eval_cases_batch(
+                params.take(np.arange(first, min(first + shard_size, len(params)))),
+                OIP.disrSizes,
+                OIP.disrProbs,
+                OIP.OIP_default_switches,
+                mkt_cases=mkt_cases,
+            )
+            for first in range(0, len(params), shard_size)
+        ]
+    )
+    return sample_results, (weights / per_stratum)[strata], strata
+
+
+def weighted_result_stats(results, weights):
+    """return numpy array (6 x components) of the `pi_stat_names` statistics of
+    weighted samples: Mean, Stddev, Min, 5th and 95th percentile, Max
+
+    results -- sample matrix; weights -- probability weight of each row
+    """
+    weights = np.asarray(weights, dtype=float) / np.sum(weights)
+    mean = weights @ results
+    std = np.sqrt(weights @ (results - mean) ** 2)
+    order = np.argsort(results, axis=0)
+    pctls = np.zeros((2, results.shape[1]))
+    for n in range(results.shape[1]):
+        w = weights[order[:, n]]
+        cum = np.cumsum(w) - 0.5 * w  # probability at the middle of each sample
+        pctls[:, n] = np.interp([0.05, 0.95], cum, results[order[:, n], n])
+    return np.array(
+        [mean, std, np.min(results, 0), pctls[0], pctls[1], np.max(results, 0)]
+    )
+
+
+def stratified_std_err(results, weights, strata):
+    """return standard error of the weighted mean of each component, from the
+    variance of the samples within each stratum (as from `simulate_OIP_stratified`)
+    """
+    num_strata = np.max(strata) + 1
+    n_s = np.bincount(strata, minlength=num_strata)
+    w_s = np.bincount(strata, weights, num_strata)
+    var_s = np.array(
+        [np.var(results[strata == s], axis=0, ddof=1) for s in range(num_strata)]
+    )
+    return np.sqrt((w_s**2 / n_s) @ var_s)
+
+
+# %%
+# bootstrap resamples for the confidence intervals of Sobol indices
+default_num_boot = 200
+
+
+def params_from_uniforms(rvDict, urvs, param_cases=None):
+    """return dictionary of samples of the random variables, from given uniforms
+
+    rvDict -- dictionary of random variables, as for `gen_test_means`\n
+    urvs -- array (samples x random variables) of uniform values, a column per
+            entry of `rvDict`, in order\n
+    param_cases -- dict of dist parameters (default = global `OIP.alt_parameter_cases`)
+    """
+    if param_cases is None:
+        param_cases = OIP.alt_parameter_cases
+    samples = {}
+    for n, (k, pp) in enumerate(rvDict.items()):
+        dist_args = _dist_args(pp, param_cases[k][:-2])
+        if dist_args is None:
+            samples[k] = np.full(len(urvs), np.nan)
+        else:
+            samples[k] = rda.inverse_cdf_dict[pp[0]](urvs[:, n], *dist_args)
+    samples["Elas:Other NonOPEC Demand"] = -samples["Elas:Other NonOPEC Supply"]
+    return samples
+
+
+def _sobol_estimates(f_A, f_B, f_AB, weights):
+    """first-order (Saltelli 2010) and total (Jansen) Sobol indices
+
+    f_A, f_B -- model outputs (samples x components) at sample matrices A and B
+    f_AB -- outputs at each matrix AB_i (factors x samples x components)
+    weights -- resample counts of the rows (resamples x samples)
+    return (S1, ST), each of dim resamples x factors x components
+    """
+    n = weights.sum(axis=1, keepdims=True)
+    mean = weights @ (f_A + f_B) / (2 * n)
+    var = weights @ (f_A**2 + f_B**2) / (2 * n) - mean**2
+    S1 = np.stack([weights @ (f_B * (f - f_A)) / n for f in f_AB], axis=1)
+    ST = np.stack([weights @ ((f_A - f) ** 2) / (2 * n) for f in f_AB], axis=1)
+    return S1 / var[:, np.newaxis], ST / var[:, np.newaxis]
+
+
+def sobol_indices(
+    num_samples=None,
+    components=None,
+    num_boot=None,
+    confidence=None,
+    seed=None,
+    method="mc",
+    mkt_cases=None,
+):
+    """variance-based (Sobol) sensitivity of premium components to the uncertain params
+
+    num_samples -- rows N of each of the sample matrices A and B (default = 10000,
+                or 8192 for method "sobol")\n
+    components -- names of the components analysed (default = all `pi_component_names`)\n
+    num_boot -- bootstrap resamples for the intervals (default = `default_num_boot`)\n
+    confidence -- confidence level of the intervals (default = `ci_confidence`)\n
+    seed -- seed (int or np.random.SeedSequence) of the design and bootstrap
+                (default = next stream spawned from `OIP.root_seed`)\n
+    method -- uniforms of A and B side by side: "mc", "lhs" or "sobol" (default = "mc")\n
+    mkt_cases -- `OIP.MarketBlock` of market data by AEO case
+                (default = from global `OIP.oilmkt_parameter_cases`)\n
+    return dataframe with a row per component and param: first-order index S1, total
+    index ST, and the bootstrap percentile interval of each\n
+
+    The factors are the entries of `OIP.parameter_probabilities`. Besides A and B, each
+    AB_i is A with column i from B, so the model is evaluated N * (factors + 2) times,
+    in batches of N through `OIP.eval_cases_batch`. Rows with an invalid (NaN) result
+    in any matrix are dropped.
+    """
+    if num_samples is None:
+        num_samples = method_size(10000, method)
+    if components is None:
+        components = pi_component_names
+    if num_boot is None:
+        num_boot = default_num_boot
+    if confidence is None:
+        confidence = ci_confidence
+    if seed is None:
+        seed = OIP.root_seed.spawn(1)[0]
+    if mkt_cases is None:
+        mkt_cases = OIP.MarketBlock.from_dict(OIP.oilmkt_parameter_cases)
+    design_seed, boot_seed = shard_seeds(seed, 2)
+    rvDict = OIP.parameter_probabilities
+    factors = list(rvDict)
+    k = len(factors)
+    design = rda.uniform_design(
+        num_samples, 2 * k, method, np.random.default_rng(design_seed)
+    )
+    A, B = design[:, :k], design[:, k:]
+    ndx = [pi_component_names.index(c) for c in components]
+
+    def evaluate(urvs):
+        params = OIP.ParamBlock.from_dict(
+            params_from_uniforms(rvDict, urvs), fill=OIP.alt_parameter_cases
+        )
+        return OIP.eval_cases_batch(
+            params,
+            OIP.disrSizes,
+            OIP.disrProbs,
+            OIP.OIP_default_switches,
+            mkt_cases=mkt_cases,
+        )[:, ndx]
+
+    f_A = evaluate(A)
+    f_B = evaluate(B)
+    f_AB = []
+    for i in range(k):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        f_AB.append(evaluate(AB))
+    f_AB = np.array(f_AB)
+    valid = (
+        np.isfinite(f_A).all(1)
+        & np.isfinite(f_B).all(1)
+        & np.isfinite(f_AB).all(axis=(0, 2))
+    )
+    if not valid.all():
+        print("sobol_indices: dropping %d invalid rows" % np.count_nonzero(~valid))
+    f_A, f_B, f_AB = f_A[valid], f_B[valid], f_AB[:, valid]
+    n = len(f_A)
+
+    S1, ST = _sobol_estimates(f_A, f_B, f_AB, np.ones((1, n)))
+    boot_rng = np.random.default_rng(boot_seed)
+    weights = boot_rng.multinomial(n, np.full(n, 1.0 / n), size=num_boot)
+    S1_b, ST_b = _sobol_estimates(f_A, f_B, f_AB, weights.astype(float))
+    q = 100.0 * np.array([0.5 - confidence / 2.0, 0.5 + confidence / 2.0])
+    S1_ci = np.percentile(S1_b, q, axis=0)
+    ST_ci = np.percentile(ST_b, q, axis=0)
+
+    rows = []
+    for c, comp in enumerate(components):
+        for i, factor in enumerate(factors):
+            rows.append(
+                {
+                    "component": comp,
+                    "param": factor,
+                    "S1": S1[0, i, c],
+                    "S1_lo": S1_ci[0, i, c],
+                    "S1_hi": S1_ci[1, i, c],
+                    "ST": ST[0, i, c],
+                    "ST_lo": ST_ci[0, i, c],
+                    "ST_hi": ST_ci[1, i, c],
+                    "num_samples": n,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def sobol_indices_over_years(num_samples=None, yearlist=[], seed=None, **kwargs):
+    """Sobol indices of the premium components for each year in `yearlist`
+
+    num_samples, seed -- as for `sobol_indices`; other keyword args are passed to it\n
+    return dataframe as from `sobol_indices`, with a year column
+
+    All years share one seed, so one design (common random numbers), and differences
+    between years come from the market data alone.
+    """
+    md = cached_workbook_read("market_data", read_OIP_market_data)
+    mkt_table = OIP.MarketTable.from_market_data(md)
+    if seed is None:
+        seed = OIP.root_seed.spawn(1)[0]
+    frames = []
+    for year in yearlist:
+        df = sobol_indices(
+            num_samples, seed=seed, mkt_cases=mkt_table.block(year), **kwargs
+        )
+        df.insert(0, "year", year)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+# %%
+def _data_hash(*data):
+    """SHA-1 of model data (dicts, lists, arrays, numbers), as settings of a run"""
+    text = json.dumps(data, sort_keys=True, default=lambda x: np.asarray(x).tolist())
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def sim_OIP_over_years(
+    num_samples=1,
+    yearlist=[],
+    workers=1,
+    shard_size=None,
+    keep_samples=True,
+    method="mc",
+    target=None,
+    target_p95=None,
+    target_components=["pi_tot"],
+    checkpoint=None,
+):
     """Simulate OIP model for samplesize `num_samples`, across years specied in `yearlist`
 
+    workers -- number of worker processes shared by all years (default = 1)
+    shard_size -- samples per shard (default = `default_shard_size`, or `default_chunk_size`
+              with a `target`; either rounded down to a power of 2 for method "sobol")
+    keep_samples -- if False, keep only a `StreamStats` accumulator for each year (default = True)
+    method -- sampling of the uncertain params: "mc", "lhs" or "sobol" (default = "mc")
+    target -- if given, sample each year in shards (default size `default_chunk_size`)
+              only until the confidence interval half-width on the mean of each of
+              `target_components` is at most `target`, or `num_samples` are used
+    target_p95 -- optional target half-width for the 95th percentile as well
+    target_components -- components the targets apply to (default = ["pi_tot"])
+    checkpoint -- optional directory in which each completed shard is saved (with the
+              run settings, hashes of the market, param and disruption data, and the
+              random stream of each year); rerunning with the same settings and data
+              and directory resumes the run, skipping the shards done, with
+              results identical to those of an uninterrupted run
+
+    Each year is simulated against its own immutable market snapshot, and the
+    shards of all years are queued on one pool, so years run concurrently.
+    Results are identical to simulating the years one after another.
     Returns
-      `yrly_rslts`, a dictionary of simulation results for each year.
+      `yrly_rslts`, a dictionary of simulation results for each year (in `yearlist` order).
     """
-    bk = linkto_workbook(model_workbook_filename)
-    md = read_OIP_market_data(bk)
+    md = cached_workbook_read("market_data", read_OIP_market_data)
+    mkt_table = OIP.MarketTable.from_market_data(md)  # all years and AEO cases
     yrly_rslts = {}
+    if num_samples == -1:  # debug - default values, against global market data
+        for year in yearlist:
+            set_market_data_for_year(mkt_table, year)
+            print(
+                "Starting year: %5d, base oil price %8.3f"
+                % (year, OIP.oilmkt_parameter_cases["import oil price"][1])
+            )
+            yrly_rslts[year] = simulate_OIP(num_samples)
+        return yrly_rslts
+
+    if shard_size is None:
+        shard_size = method_size(
+            default_shard_size if target is None else default_chunk_size, method
+        )
+    year_seeds = OIP.root_seed.spawn(len(yearlist))  # as for successive simulate_OIP
+    if checkpoint is not None:  # resumed runs keep the streams of the first attempt
+        settings = {
+            "num_samples": num_samples,
+            "years": [int(y) for y in yearlist],
+            "shard_size": shard_size,
+            "keep_samples": keep_samples,
+            "method": method,
+            "target": target,
+            "target_p95": target_p95,
+            "target_components": list(target_components),
+            "market_data": hashlib.sha1(mkt_table.values.tobytes()).hexdigest(),
+            "param_cases": _data_hash(OIP.alt_parameter_cases),
+            "param_distributions": _data_hash(OIP.parameter_probabilities),
+            "switches": [float(s) for s in OIP.OIP_default_switches],
+            "disruptions": _data_hash(OIP.disrSizes, OIP.disrProbs),
+        }
+        checkpoint = RunCheckpoint(
+            checkpoint, settings, dict(zip(settings["years"], year_seeds))
+        )
+        year_seeds = [checkpoint.year_seeds[int(y)] for y in yearlist]
+        print("Checkpoint: %d shards done" % len(checkpoint))
+    year_shards = {}  # list of shards for each year
+    for year, seed in zip(yearlist, year_seeds):
+        mkt_cases = mkt_table.block(year)
+        print("Scheduling year: %5d, base oil price %8.3f" % (year, mkt_cases.P_i0[1]))
+        year_shards[year] = _shard_tasks(
+            num_samples, seed, shard_size, mkt_cases, keep_samples, method, year=year
+        )
+    if target is not None:  # precision-targeted: each year stops when precise enough
+        yrly_rslts = _run_to_precision(
+            year_shards, workers, target, target_p95, target_components, checkpoint
+        )
+        precision_report(yrly_rslts, target_components, target, target_p95)
+        return yrly_rslts
+    shards = [sh for year in yearlist for sh in year_shards[year]]
+    shard_results = _run_shards(shards, workers, checkpoint)  # in order of `shards`
+    num_tracked_vars = len(pi_component_names)
     for year in yearlist:
-        set_market_data_for_year(md, year)
-        print(
-            "Starting year: %5d, base oil price %8.3f"
-            % (year, OIP.oilmkt_parameter_cases["import oil price"][1])
+        yrly_rslts[year] = _gather_shards(
+            itertools.islice(shard_results, len(year_shards[year])), num_tracked_vars
         )
-        yrly_rslts[year] = simulate_OIP(num_samples)
     return yrly_rslts
 
 
+# %%
+# rows per `OIP.eval_cases_batch` call in `scenario_grid`: without keep_samples,
+# its memory use is bounded by max(grid_max_rows, num_samples) rows
+grid_max_rows = 200000
+
+
+def _cell_stats(results):
+    """statistics (as `result_stats`) of each cell of results, cells x samples x components"""
+    return np.stack(
+        [
+            np.mean(results, axis=-2),
+            np.std(results, axis=-2),
+            np.min(results, axis=-2),
+            np.percentile(results, 5.0, axis=-2),
+            np.percentile(results, 95.0, axis=-2),
+            np.max(results, axis=-2),
+        ],
+        axis=-2,
+    )
+
+
+def scenario_grid(
+    num_samples=1000,
+    prob_cases=None,
+    aeo_cases=None,
+    years=None,
+    switch_sets=None,
+    seed=None,
+    method="mc",
+    keep_samples=False,
+):
+    """evaluate every combination of scenario axes, on one shared set of param draws
+
+    num_samples -- param samples, shared by all cells of the grid (default = 1000)\n
+    prob_cases -- names of disruption probability cases in `OIP.disr_size_prob_cases`
+                (default = all of them)\n
+    aeo_cases -- values of "Oil Market (AEO) Case" (default = [1, 2, 3])\n
+    years -- market data years (default = None: global `OIP.oilmkt_parameter_cases`)\n
+    switch_sets -- list of switch lists (default = [`OIP.OIP_default_switches`])\n
+    seed -- seed of the param draws (default = next stream spawned from `OIP.root_seed`)\n
+    method -- sampling of the uncertain params: "mc", "lhs" or "sobol" (default = "mc")\n
+    keep_samples -- if True, also return the sample results (default = False)\n
+    return `grid_stats`, a dataframe of `pi_stat_names` statistics of each component,
+    indexed by (switches, prob_case, aeo_case, year, stat), or (grid_stats, cube) if
+    keep_samples, cube the array of sample results with dims switches x prob_case x
+    aeo_case x year x sample x component
+
+    The cells of the grid are stacked along the sample axis and evaluated in batches
+    of up to `grid_max_rows` rows, with per-row disruption probabilities, AEO case
+    and year. Only switch sets are evaluated in separate batches. The statistics of
+    each cell are taken as its batch is done; the cube of all samples is only
+    allocated if keep_samples.
+    """
+    if prob_cases is None:
+        prob_cases = [k for k in OIP.disr_size_prob_cases if k != "DisrSize"]
+    if aeo_cases is None:
+        aeo_cases = [1, 2, 3]
+    if switch_sets is None:
+        switch_sets = [OIP.OIP_default_switches]
+    if seed is None:
+        seed = OIP.root_seed.spawn(1)[0]
+    if years is None:
+        mkt_cases = OIP.MarketBlock.from_dict(OIP.oilmkt_parameter_cases)
+        year_axis = [None]
+    else:
+        md = cached_workbook_read("market_data", read_OIP_market_data)
+        mkt_cases = OIP.MarketTable.from_market_data(md)
+        year_axis = list(years)
+    sam = gen_test_means(
+        OIP.parameter_probabilities,
+        samplesz=num_samples,
+        param_cases=OIP.alt_parameter_cases,
+        rng=np.random.default_rng(seed),
+        method=method,
+    )
+    params = OIP.ParamBlock.from_dict(sam, fill=OIP.alt_parameter_cases)
+    probs = np.array([OIP.disr_size_prob_cases[c] for c in prob_cases], dtype=float)
+    case_row = [sym for sym, key in OIP.param_fields].index("case_oilmkt")
+    cells = np.array(
+        list(
+            itertools.product(
+                range(len(prob_cases)), range(len(aeo_cases)), range(len(year_axis))
+            )
+        )
+    )  # in cube order
+    cells_per_batch = max(1, grid_max_rows // num_samples)
+    num_tracked_vars = len(pi_component_names)
+    grid_shape = (len(switch_sets), len(prob_cases), len(aeo_cases), len(year_axis))
+    grid_stats = np.empty(grid_shape + (len(pi_stat_names), num_tracked_vars))
+    cube = None
+    if keep_samples:
+        cube = np.empty(grid_shape + (num_samples, num_tracked_vars))
+    for s, switches in enumerate(switch_sets):
+        stats_out = grid_stats[s].reshape(-1, len(pi_stat_names), num_tracked_vars)
+        for first in range(0, len(cells), cells_per_batch):
+            p_ndx, a_ndx, y_ndx = cells[first : first + cells_per_batch].T
+            values = np.tile(params.values, len(p_ndx))
+            values[case_row] = np.repeat(np.asarray(aeo_cases)[a_ndx], num_samples)
+            results = OIP.eval_cases_batch(
+                OIP.ParamBlock(values),
+                OIP.disrSizes,
+                np.repeat(probs[p_ndx], num_samples, axis=0),
+                switches,
+                mkt_cases=mkt_cases,
+                years=(
+                    None
+                    if years is None
+                    else np.repeat(np.asarray(year_axis)[y_ndx], num_samples)
+                ),
+            )
+            results = results.reshape(len(p_ndx), num_samples, num_tracked_vars)
+            stats_out[first : first + len(p_ndx)] = _cell_stats(results)
+            if keep_samples:
+                cells_out = cube[s].reshape(-1, num_samples, num_tracked_vars)  # view
+                cells_out[first : first + len(p_ndx)] = results
+
+    index = pd.MultiIndex.from_product(
+        [range(len(switch_sets)), prob_cases, aeo_cases, year_axis, pi_stat_names],
+        names=["switches", "prob_case", "aeo_case", "year", "stat"],
+    )
+    grid_stats = pd.DataFrame(
+        grid_stats.reshape(-1, num_tracked_vars),
+        index=index,
+        columns=pi_component_names,
+    )
+    if keep_samples:
+        return grid_stats, cube
+    return grid_stats
+
+
 # %%
 def loadtest_OIPRandomFix():
     """read model excel sheet for RandomFix param values & switches,
@@ -414,15 +1590,18 @@ def loadtest_OIPRandomFix():
     reports/displays solution for (non-opt) premium pi, vs excel
     """
     random_fix_index = 4
-    bk = linkto_workbook(model_workbook_filename)
-    kprf = read_OIPRandomFix(bk)
+    random_fix = cached_workbook_read(
+        "random_fix",
+        lambda bk: {"params": read_OIPRandomFix(bk), "switches": read_OIPswitches(bk)},
+    )
+    kprf = random_fix["params"]
 
     for k in kprf:
         if k in OIP.alt_parameter_cases:
             OIP.alt_parameter_cases[k][random_fix_index] = kprf[k]
         else:
             print("Skipping non-input: ", k)
-    OIP.OIP_default_switches = read_OIPswitches(bk)
+    OIP.OIP_default_switches = random_fix["switches"]
     print("OIP switches: ", OIP.OIP_default_switches)
 
     # solve the case and compare
@@ -470,18 +1649,46 @@ def gen_yearly_result_stats(yrly_rslts, component_names):
 
 
 # %%
-def run_OIP(num_samples=1, yearstep=5):
+def run_OIP(
+    num_samples=1,
+    yearstep=5,
+    workers=1,
+    keep_samples=True,
+    method="mc",
+    target=None,
+    target_p95=None,
+    target_components=["pi_tot"],
+    checkpoint=None,
+):
     """Execute OIP model for samplesize "num_samples", across full time horizon with time step "yearstep"
 
     num_samples -- number of samples to run in Monte Carlo process (default=1)
     yearstep -- interval between the years for which simulations are to be done (default=5)
+    workers -- number of worker processes, shared by all years (default=1)
+    keep_samples -- if False, keep only streaming statistics, not the samples (default=True)
+    method -- sampling of the uncertain params: "mc", "lhs" or "sobol" (default="mc")
+    target, target_p95, target_components -- optional precision targets: each year then
+        stops sampling once they are met, with "num_samples" as its budget (see
+        `sim_OIP_over_years`)
+    checkpoint -- optional directory saving each completed shard of samples, from
+        which an interrupted run resumes (see `sim_OIP_over_years`)
     Returns
       "yearly_stats" dictionary of summary statistics for each year, and
       "yearly_results" dictionary of simulation results for each year.
     """
     global pi_component_names
     years = range(2010, 2036, yearstep)
-    yearly_rslts = sim_OIP_over_years(num_samples, years)
+    yearly_rslts = sim_OIP_over_years(
+        num_samples,
+        years,
+        workers=workers,
+        keep_samples=keep_samples,
+        method=method,
+        target=target,
+        target_p95=target_p95,
+        target_components=target_components,
+        checkpoint=checkpoint,
+    )
     yearly_stats = gen_yearly_result_stats(yearly_rslts, pi_component_names)
     return (yearly_stats, yearly_rslts)
 
@@ -501,6 +1708,34 @@ def read_results(filename=""):
     return pickle.load(pkl_file_ptr)
 
 
+# %%
+def save_results_store(full_results, path="results1"):
+    """write (yearly_stats, yearly_results) to a memory-mapped `ResultsStore` directory
+
+    full_results -- tuple (yearly_stats, yearly_results) as returned by `run_OIP`
+    path -- store directory (default = "results1")
+    Samples are stored only for years with a sample matrix (not `StreamStats`).
+    Returns the store, opened for writing
+    """
+    yearly_stats, yearly_results = full_results
+    store = ResultsStore(
+        path, mode="w", component_names=pi_component_names, stat_names=pi_stat_names
+    )
+    for year in yearly_stats:
+        samples = yearly_results.get(year) if yearly_results else None
+        if isinstance(samples, StreamStats):
+            samples = None
+        store.write_year(year, samples=samples, stats=yearly_stats[year])
+    return store
+
+
+def read_results_store(path="results1"):
+    """open a results store read-only; arrays are loaded on access, e.g.
+    `store.samples(2030, "pi_d")` or `store.stats(stat="95th percentile", component="pi_tot")`
+    """
+    return ResultsStore(path)
+
+
 # %%
 def dict_to_array(d):
     # assumes that each element of dictionary is of same shape
@@ -538,54 +1773,153 @@ def save_stats_to_CSV(rslts, filename=""):
     """
     if filename == "":
         filename = "OIPV014_BaseStats.csv"
-    writer = csv.writer(open(filename, "wb"))
-    for y in rslts[0]:  # loop over years
-        writer.writerow(y)
-        writer.writerows(rslts[0][y])
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        for y in rslts[0]:  # loop over years
+            writer.writerow([y])
+            writer.writerows(rslts[0][y])
+
+
+# %%
+def results_to_long(full_results, run=""):
+    """convert (yearly_stats, yearly_results) to long/tidy dataframes
+
+    full_results -- tuple (yearly_stats, yearly_results) as returned by `run_OIP`
+    run -- run (or runset) label stored in every row (default = "")
+    return (stats_df, samples_df): stats_df has columns run, year, component, stat, value;
+    samples_df has columns run, year, sample, component, value (None if no samples kept)
+    """
+    yearly_stats, yearly_results = full_results
+    years = list(yearly_stats)
+    st = np.array([yearly_stats[y] for y in years])  # years x stats x components
+    ny, ns, nc = st.shape
+    stats_df = pd.DataFrame(
+        {
+            "run": run,
+            "year": np.repeat(years, ns * nc),
+            "component": pd.Categorical.from_codes(
+                np.tile(np.arange(nc), ny * ns), pi_component_names[:nc]
+            ),
+            "stat": pd.Categorical.from_codes(
+                np.tile(np.repeat(np.arange(ns), nc), ny), pi_stat_names[:ns]
+            ),
+            "value": st.reshape(-1),
+        }
+    )
+    sample_years = [
+        y
+        for y in years
+        if yearly_results and isinstance(yearly_results.get(y), np.ndarray)
+    ]
+    if not sample_years:
+        return stats_df, None
+    sm = [yearly_results[y] for y in sample_years]  # each samples x components
+    nc = sm[0].shape[1]
+    counts = np.array([len(r) for r in sm])
+    samples_df = pd.DataFrame(
+        {
+            "run": run,
+            "year": np.repeat(sample_years, counts * nc),
+            "sample": np.concatenate([np.repeat(np.arange(n), nc) for n in counts]),
+            "component": pd.Categorical.from_codes(
+                np.tile(np.arange(nc), counts.sum()), pi_component_names[:nc]
+            ),
+            "value": np.concatenate([r.reshape(-1) for r in sm]),
+        }
+    )
+    return stats_df, samples_df
+
+
+def _write_table(df, filename):
+    """write dataframe by file extension: .feather/.arrow, .parquet, else .csv
+
+    Falls back to .csv if the Arrow/Parquet library (pyarrow) is not installed.
+    return name of file written
+    """
+    stem, ext = os.path.splitext(filename)
+    try:
+        if ext in (".feather", ".arrow"):
+            df.to_feather(filename)
+            return filename
+        if ext == ".parquet":
+            df.to_parquet(filename, index=False)
+            return filename
+    except ImportError as err:
+        print("Writing CSV instead of %s (%s)" % (ext, err))
+        filename = stem + ".csv"
+    df.to_csv(filename, index=False)
+    return filename
+
+
+def export_results(full_results, filename="OIP_results.feather", run="", samples=False):
+    """export results in long/tidy columnar form for the R post-processing
+
+    full_results -- tuple (yearly_stats, yearly_results) as returned by `run_OIP`
+    filename -- stats output file; format from extension .feather, .parquet or .csv
+    run -- run (or runset) label stored in every row (default = "")
+    samples -- if True, also write sample results to "<name>_samples<ext>" (default = False)
+    return list of files written
+    """
+    stats_df, samples_df = results_to_long(full_results, run)
+    written = [_write_table(stats_df, filename)]
+    if samples and samples_df is not None:
+        stem, ext = os.path.splitext(filename)
+        written.append(_write_table(samples_df, stem + "_samples" + ext))
+    return written
 
 
 # %% [markdown]
 # Execution area
 # ---------------------------------------------------------
+# (guarded so that pool worker processes can import this module)
 
 # %%
 # read current RandomFix case in workbook, compare to calculated results
-test_kprf = loadtest_OIPRandomFix()
+if __name__ == "__main__":
+    test_kprf = loadtest_OIPRandomFix()
 
 # %%
 # Execute Test run, one year, one sample case:
-case_rslts = sim_OIP_over_years(num_samples=-1, yearlist=[2015])
-case_rslts_df = pd.DataFrame(data=case_rslts, index=pi_component_names, columns=None)
+if __name__ == "__main__":
+    case_rslts = sim_OIP_over_years(num_samples=-1, yearlist=[2015])
+    case_rslts_df = pd.DataFrame(
+        data=case_rslts, index=pi_component_names, columns=None
+    )
 
 
 # %%
 # Execute Full run, multiple yaers and sample iterations
-annual_stats, annual_rslts = run_OIP(num_samples=10000, yearstep=5)
+if __name__ == "__main__":
+    annual_stats, annual_rslts = run_OIP(num_samples=10000, yearstep=5)
 
 
 # %%
 # `annual_rslts` and `annual_stats` are dictionaries indexed by year, each element of which is array
 # np.size(annual_rslts)  # annual_rslts is a dictionary, so size gives little info
-annual_rslts.keys()  # keys are the years for each annual results array
-np.size(annual_rslts[2020])  # num_samples x len(pi_component_names)
-np.shape(annual_rslts[2020])
+if __name__ == "__main__":
+    annual_rslts.keys()  # keys are the years for each annual results array
+    np.size(annual_rslts[2020])  # num_samples x len(pi_component_names)
+    np.shape(annual_rslts[2020])
 
 # save_stats_to_CSV(annual_rslts,"testResults.csv") # does not work b.c. expects an array, not dictionary
 
 # %%
 # convert sample results to dataframe
 # annual_rslts_df = pd.DataFrame.from_dict(annual_rslts[2020]) # only works if each element of dict is an (equal length) column
-annual_rslts_df = pd.DataFrame(
-    annual_rslts[2020], columns=pi_component_names
-)  # index is sample num
+if __name__ == "__main__":
+    annual_rslts_df = pd.DataFrame(
+        annual_rslts[2020], columns=pi_component_names
+    )  # index is sample num
 
 # %%
 # convert sample stats to dataframe
-annual_stats_df = pd.DataFrame(
-    annual_stats[2020], columns=pi_component_names
-)  # index could be pi_stat_names
+if __name__ == "__main__":
+    annual_stats_df = pd.DataFrame(
+        annual_stats[2020], columns=pi_component_names
+    )  # index could be pi_stat_names
 
 
 # %%
-annual_stats_df
+if __name__ == "__main__":
+    annual_stats_df
 # %%
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+workbook_cache.py
+Persistent cache of data parsed from model workbooks, so that a workbook is
+parsed once and later runs load a compact snapshot instead.
+
+    <cache_dir>/<workbook>-<pathhash>.<name>.json   key, and non-array data
+    <cache_dir>/<workbook>-<pathhash>.<name>.npz    numeric arrays, pickled DataFrames
+
+A snapshot is keyed by the workbook's absolute path, modification time, size
+and content hash (SHA-1), and by the reader: its module, qualified name and a
+hash of its code (and of the code of functions it closes over). An unchanged
+mtime and size is taken as a hit without rehashing; otherwise the content hash
+decides, so a touched but unchanged workbook is not reparsed.
+"""
+import hashlib
+import json
+import os
+import pickle
+import types
+import uuid
+
+import numpy as np
+import pandas as pd
+
+cache_version = 2  # bump when the snapshot layout changes
+default_cache_dir = None  # None: ".wbcache" directory next to the workbook
+
+
+def file_hash(filename, blocksize=1 << 20):
+    """return SHA-1 hex digest of the contents of `filename`"""
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _hash_code(code, h):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            _hash_code(c, h)
+        else:
+            h.update(repr(c).encode())
+
+
+def _hash_callable(fn, h):
+    code = getattr(fn, "__code__", None)
+    if code is None:  # builtin or callable object: known by its name only
+        return
+    _hash_code(code, h)
+    for cell in fn.__closure__ or ():
+        try:
+            v = cell.cell_contents
+        except ValueError:  # empty cell
+            continue
+        if callable(v):  # e.g. the reader called by a wrapping lambda
+            h.update(("%s.%s" % (v.__module__, v.__qualname__)).encode())
+            _hash_callable(v, h)
+
+
+def reader_key(reader):
+    """return dict identifying `reader`: module, qualified name and SHA-1 of its code"""
+    h = hashlib.sha1()
+    _hash_callable(reader, h)
+    return {
+        "module": getattr(reader, "__module__", None),
+        "qualname": getattr(reader, "__qualname__", type(reader).__qualname__),
+        "code": h.hexdigest(),
+    }
+
+
+def _cache_files(wb_path, name, cache_dir):
+    if cache_dir is None:
+        cache_dir = default_cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(wb_path), ".wbcache")
+    stem = "%s-%s.%s" % (
+        os.path.basename(wb_path),
+        hashlib.sha1(wb_path.encode()).hexdigest()[:8],
+        name,
+    )
+    stem = os.path.join(cache_dir, stem)
+    return stem + ".json", stem + ".npz"
+
+
+# -------------------------------------------------------------------------
+def _encode(obj, arrays, key):
+    """JSON-ready form of `obj`, moving numeric arrays into `arrays`"""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind in "biuf":
+            arrays[key] = obj
+            return {"__npz__": key}
+        return {"__array__": obj.tolist()}
+    if isinstance(obj, pd.DataFrame):  # pickled whole: dtypes (e.g. dates) kept
+        arrays[key] = np.frombuffer(pickle.dumps(obj), dtype=np.uint8)
+        return {"__dataframe__": key}
+    if isinstance(obj, dict):
+        return {k: _encode(v, arrays, "%s/%s" % (key, k)) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_encode(v, arrays, "%s/%d" % (key, n)) for n, v in enumerate(obj)]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _decode(obj, arrays):
+    if isinstance(obj, dict):
+        if "__npz__" in obj:
+            return arrays[obj["__npz__"]]
+        if "__array__" in obj:
+            return np.array(obj["__array__"])
+        if "__dataframe__" in obj:
+            return pickle.loads(arrays[obj["__dataframe__"]].tobytes())
+        return {k: _decode(v, arrays) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_decode(v, arrays) for v in obj]
+    return obj
+
+
+# -------------------------------------------------------------------------
+def _read_snapshot(json_file):
+    """return the stored snapshot (key and encoded data), or None if missing or unreadable"""
+    try:
+        with open(json_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _load(snapshot, npz_file):
+    """return the snapshot data, or None if its .npz is missing or of another write"""
+    arrays = {}
+    if snapshot["has_arrays"]:
+        try:
+            with np.load(npz_file) as npz:
+                arrays = {k: npz[k] for k in npz.files}
+        except (OSError, ValueError):
+            return None
+        if str(arrays.pop("__token__", "")) != snapshot["token"]:
+            return None  # interrupted between the two file replacements
+    return _decode(snapshot["data"], arrays)
+
+
+def _write(json_file, npz_file, key, data):
+    """write the snapshot: both files to temporary names, then replaced, .json last
+
+    A token shared by the two files marks them as of the same write.
+    """
+    os.makedirs(os.path.dirname(json_file), exist_ok=True)
+    arrays = {}
+    snapshot = {
+        "key": key,
+        "has_arrays": False,
+        "token": uuid.uuid4().hex,
+        "data": _encode(data, arrays, "data"),
+    }
+    if arrays:
+        snapshot["has_arrays"] = True
+        arrays["__token__"] = np.array(snapshot["token"])
+        with open(npz_file + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+    with open(json_file + ".tmp", "w") as f:
+        json.dump(snapshot, f)
+    if arrays:
+        os.replace(npz_file + ".tmp", npz_file)
+    os.replace(json_file + ".tmp", json_file)
+
+
+def cached_read(wb_path, name, reader, cache_dir=None, refresh=False, reader_args=None):
+    """return `reader(wb_path)`, from the cache if the workbook and reader are unchanged
+
+    wb_path -- workbook filename\n
+    name -- name of this parse of the workbook (one snapshot per name)\n
+    reader -- function of the workbook filename, returning the parsed data: nested
+              dicts/lists of numpy arrays, DataFrames and JSON-compatible values\n
+    cache_dir -- snapshot directory (default = `default_cache_dir`)\n
+    refresh -- if True, reparse the workbook and rewrite the snapshot (default = False)\n
+    reader_args -- optional JSON-compatible values the parse also depends on (e.g.
+              a sheet name the reader takes from a global), part of the key\n
+    Changes to helper functions the reader calls are not detected: pass refresh=True
+    """
+    wb_path = os.path.abspath(wb_path)
+    json_file, npz_file = _cache_files(wb_path, name, cache_dir)
+    st = os.stat(wb_path)
+    key = {
+        "version": cache_version,
+        "path": wb_path,
+        "mtime": st.st_mtime,
+        "size": st.st_size,
+        "reader": reader_key(reader),
+        "reader_args": json.loads(json.dumps(reader_args)),
+    }
+    snapshot = None if refresh else _read_snapshot(json_file)
+    cached = {} if snapshot is None else snapshot["key"]
+    data = None
+    if snapshot is not None and all(cached.get(k) == v for k, v in key.items()):
+        data = _load(snapshot, npz_file)
+        if data is not None:
+            return data
+    key["sha1"] = file_hash(wb_path)
+    if snapshot is not None and all(
+        cached.get(k) == key[k] for k in ("version", "reader", "reader_args", "sha1")
+    ):
+        data = _load(snapshot, npz_file)  # touched, but contents unchanged
+    if data is None:
+        data = reader(wb_path)
+    _write(json_file, npz_file, key, data)
+    return data